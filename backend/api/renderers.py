@@ -0,0 +1,100 @@
+import math
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+def same_float_repr(value: float) -> bool:
+    """orjson пишет float так же, как json, кроме записи с экспонентой
+    (1e20 вместо 1e+20) и NaN/Infinity (null вместо ошибки)"""
+    return value == 0 or (math.isfinite(value) and 1e-4 <= abs(value) < 1e16)
+
+
+def orjson_compatible(data: object) -> bool:
+    """нет ли в данных float, которые orjson выведет иначе, чем json"""
+    stack = [data]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, float):
+            if not same_float_repr(item):
+                return False
+        elif isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return True
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson с тем же выводом, что у стандартного.
+
+    Компактные разделители и UTF-8 без экранирования, как при UNICODE_JSON,
+    UTC-время с суффиксом Z, а все, что orjson не знает сам (Decimal, ленивые
+    строки, QuerySet и т.д.), отдается JSONEncoder из DRF. Запросы с отступами
+    (браузерный API, indent в Accept), значения, которые orjson не умеет,
+    и float, которые он пишет иначе (экспонента, NaN и бесконечность),
+    рендерятся стандартным JSONRenderer.
+    """
+
+    options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z) if orjson else 0
+
+    def render(
+        self,
+        data: object,
+        accepted_media_type: str | None = None,
+        renderer_context: dict | None = None,
+    ) -> bytes:
+        if data is None:
+            return b""
+        renderer_context = renderer_context or {}
+        if (
+            orjson is None
+            or self.get_indent(accepted_media_type, renderer_context)
+            or not orjson_compatible(data)
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # как и JSONRenderer, экранируем разделители строк, недопустимые в JS
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+
+    def default(self, obj: object) -> object:
+        """JSONEncoder из DRF, Decimal он превращает в float"""
+        value = self.encoder_class().default(obj)
+        if not orjson_compatible(value):
+            raise TypeError(f"{obj!r} рендерится стандартным JSONRenderer")
+        return value
+
+
+class MessagePackRenderer(BaseRenderer):
+    """ответ в MessagePack для внутренних клиентов (Accept: application/msgpack)"""
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(
+        self,
+        data: object,
+        accepted_media_type: str | None = None,
+        renderer_context: dict | None = None,
+    ) -> bytes:
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
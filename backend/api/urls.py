@@ -20,7 +20,10 @@ from shopapp.views import (
     ProductReviewView,
     TagsListView,
     SalesListView,
+    SuggestView,
     BasketView,
+    BasketBulkView,
+    BasketSummaryView,
     OrderView,
     OrderDetailView,
     PaymentView,
@@ -34,21 +37,24 @@ urlpatterns = [
         name="swagger",
     ),
     path("sign-out", SignOutAPIView.as_view()),
-    path("sign-in", SignInAPIView.as_view()),
+    path("sign-in", SignInAPIView.as_view(), name='sign-in'),
     path("sign-up", SignUpAPIView.as_view(), name='sign-up'),
     path("profile", ProfileUserAPIView.as_view(), name='profile'),
     path("profile/avatar", AvatarChangeAPIView.as_view()),
     path("profile/password", ChangePasswordAPIView.as_view()),
     path("categories", CategoryView.as_view(), name='categories'),
-    path("catalog", CatalogView.as_view()),
+    path("catalog", CatalogView.as_view(), name='catalog'),
     path("banners", BannerListView.as_view(), name='banners'),
-    path("tags", TagsListView.as_view()),
+    path("tags", TagsListView.as_view(), name="tags"),
     path("products/popular", PopularListView.as_view(), name='products-popular'),
     path("products/limited", LimitedListView.as_view()),
-    path("sales", SalesListView.as_view()),
+    path("sales", SalesListView.as_view(), name="sales"),
+    path("search/suggest", SuggestView.as_view(), name='search-suggest'),
     path("product/<int:product_id>", ProductDetailView.as_view(), name='product-detail'),
     path("product/<int:product_id>/reviews", ProductReviewView.as_view(), name='product-review'),
     path("basket", BasketView.as_view(), name='basket'),
+    path("basket/bulk", BasketBulkView.as_view(), name='basket-bulk'),
+    path("basket/summary", BasketSummaryView.as_view(), name='basket-summary'),
     path("orders", OrderView.as_view(), name='orders'),
     path("order/<int:order_id>", OrderDetailView.as_view(), name='order-detail'),
     path("payment/<int:order_id>", PaymentView.as_view(), name='payment'),
@@ -0,0 +1,174 @@
+import gzip
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponseBase
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# типы ответов, которые имеет смысл сжимать (картинки и архивы уже сжаты)
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/manifest+json",
+    "image/svg+xml",
+)
+
+# расширения статики, для которых собираются .br/.gz копии
+COMPRESSIBLE_EXTENSIONS = {
+    ".css",
+    ".js",
+    ".mjs",
+    ".map",
+    ".json",
+    ".html",
+    ".txt",
+    ".xml",
+    ".svg",
+    ".ico",
+    ".ttf",
+    ".otf",
+    ".eot",
+}
+
+# расширения сжатых копий по кодировкам в порядке предпочтения
+ENCODING_EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+
+
+def supported_encodings() -> list[str]:
+    """кодировки, которые умеет сервер, в порядке предпочтения"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def accepted_encodings(header: str) -> set[str]:
+    """кодировки из Accept-Encoding, кроме явно запрещенных через q=0"""
+    encodings = set()
+    for part in header.lower().split(","):
+        name, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name and quality > 0:
+            encodings.add(name)
+    if "*" in encodings:
+        encodings.update(supported_encodings())
+    return encodings
+
+
+def choose_encoding(request: HttpRequest, allow_brotli: bool = True) -> str | None:
+    """лучшая кодировка, которую принимает клиент и умеет сервер"""
+    accepted = accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    for encoding in supported_encodings():
+        if encoding == "br" and not allow_brotli:
+            continue
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def brotli_sequence(sequence):
+    """сжатие потока ответа brotli по мере генерации"""
+    compressor = brotli.Compressor(quality=5)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+        yield compressor.flush()
+    yield compressor.finish()
+
+
+def compress_file(path: Path) -> list[Path]:
+    """пишет рядом с файлом .gz (и .br, если есть brotli) копии,
+    если они меньше оригинала; возвращает записанные файлы"""
+    content = path.read_bytes()
+    compressed = {
+        "gzip": gzip.compress(content, compresslevel=9, mtime=0),
+    }
+    if brotli is not None:
+        compressed["br"] = brotli.compress(content, quality=11)
+    written = []
+    for encoding, data in compressed.items():
+        sibling = path.with_name(path.name + ENCODING_EXTENSIONS[encoding])
+        if len(data) >= len(content):
+            sibling.unlink(missing_ok=True)
+            continue
+        sibling.write_bytes(data)
+        written.append(sibling)
+    return written
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """Сжимает ответы gzip или brotli (если установлен пакет brotli).
+
+    Сжимаются только текстовые типы и только ответы не меньше
+    COMPRESSION_MIN_SIZE, потоковые ответы сжимаются по мере генерации.
+    Как и у GZipMiddleware, к gzip добавляется случайное имя файла против BREACH.
+    У brotli такого заполнения нет, поэтому HTML (в нем csrf-токен) сжимается
+    только gzip.
+    """
+
+    def process_response(
+        self, request: HttpRequest, response: HttpResponseBase
+    ) -> HttpResponseBase:
+        if response.has_header("Content-Encoding"):
+            return response
+        # Content-Range описывает несжатые байты, частичный ответ не сжимаем
+        if response.status_code == 206 or response.has_header("Content-Range"):
+            return response
+        content_type = response.get("Content-Type", "").lower()
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+        if (
+            not response.streaming
+            and len(response.content) < settings.COMPRESSION_MIN_SIZE
+        ):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = choose_encoding(
+            request, allow_brotli=not content_type.startswith("text/html")
+        )
+        if encoding is None or getattr(response, "is_async", False):
+            return response
+
+        if response.streaming:
+            if encoding == "br":
+                response.streaming_content = brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(
+                    response.streaming_content,
+                    max_random_bytes=self.max_random_bytes,
+                )
+            del response.headers["Content-Length"]
+        else:
+            if encoding == "br":
+                compressed_content = brotli.compress(response.content, quality=5)
+            else:
+                compressed_content = compress_string(
+                    response.content,
+                    max_random_bytes=self.max_random_bytes,
+                )
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers["Content-Length"] = str(len(response.content))
+
+        # сжатое представление уже не байт в байт то же, ETag становится слабым
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -0,0 +1,152 @@
+import mimetypes
+import posixpath
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseBase,
+    HttpResponseNotModified,
+)
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.static import was_modified_since
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def resolve_path(document_root: str | Path, path: str) -> Path:
+    """путь к файлу внутри document_root, Http404 если файла нет"""
+    path = posixpath.normpath(path).lstrip("/")
+    fullpath = Path(safe_join(document_root, path))
+    if not fullpath.is_file():
+        raise Http404(path)
+    return fullpath
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """границы (включительно) из Range: bytes=..., None - отдавать файл целиком,
+    ValueError - диапазон за пределами файла"""
+    match = RANGE_RE.match(header.strip())
+    if match is None or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":
+        # bytes=-500 - последние 500 байт
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+class FileRange:
+    """файловый объект, который отдает только часть файла"""
+
+    block_size = 64 * 1024
+
+    def __init__(self, file, start: int, length: int) -> None:
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def file_response(
+    request: HttpRequest,
+    fullpath: Path,
+    url: str,
+    content_type: str | None = None,
+    encoding: str | None = None,
+    max_age: int | None = None,
+    immutable: bool = False,
+) -> HttpResponseBase:
+    """Ответ с файлом с диска.
+
+    Поддерживает If-Modified-Since и Range. Если задан ACCEL_REDIRECT_PREFIX,
+    файл не читается приложением: nginx получает X-Accel-Redirect на
+    internal-локацию с тем же url и отдает его сам, вместе с диапазонами.
+    Иначе FileResponse, который WSGI-сервер отдает через sendfile.
+    """
+    statobj = fullpath.stat()
+    last_modified = http_date(statobj.st_mtime)
+    if content_type is None:
+        content_type, _ = mimetypes.guess_type(str(fullpath))
+    content_type = content_type or "application/octet-stream"
+
+    if not was_modified_since(
+        request.META.get("HTTP_IF_MODIFIED_SINCE"), statobj.st_mtime
+    ):
+        response = HttpResponseNotModified()
+    elif settings.ACCEL_REDIRECT_PREFIX:
+        response = HttpResponse(content_type=content_type)
+        response.headers["X-Accel-Redirect"] = (
+            settings.ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + url.lstrip("/")
+        )
+    else:
+        response = ranged_file_response(request, fullpath, statobj, content_type)
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+    response.headers["Last-Modified"] = last_modified
+    if max_age is not None:
+        patch_cache_control(response, public=True, max_age=max_age)
+        if immutable:
+            patch_cache_control(response, immutable=True)
+    return response
+
+
+def ranged_file_response(
+    request: HttpRequest, fullpath: Path, statobj, content_type: str
+) -> HttpResponseBase:
+    """FileResponse целиком или 206 с одним диапазоном из заголовка Range"""
+    size = statobj.st_size
+    requested = request.META.get("HTTP_RANGE")
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range and parse_http_date_safe(if_range) != int(statobj.st_mtime):
+        requested = None
+    try:
+        bounds = parse_range(requested, size) if requested else None
+    except ValueError:
+        response = HttpResponse(status=416, content_type=content_type)
+        response.headers["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if bounds is None:
+        response = FileResponse(fullpath.open("rb"), content_type=content_type)
+    else:
+        start, end = bounds
+        response = FileResponse(
+            FileRange(fullpath.open("rb"), start, end - start + 1),
+            content_type=content_type,
+            status=206,
+        )
+        response.headers["Content-Length"] = str(end - start + 1)
+        response.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
+
+
+def serve_media(request: HttpRequest, path: str) -> HttpResponseBase:
+    """отдает загруженные файлы из MEDIA_ROOT"""
+    fullpath = resolve_path(settings.MEDIA_ROOT, path)
+    return file_response(
+        request,
+        fullpath,
+        settings.MEDIA_URL + path,
+        max_age=settings.MEDIA_MAX_AGE,
+    )
@@ -0,0 +1,210 @@
+import io
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, models, transaction
+from django.db.models.fields.files import FieldFile
+from django.dispatch import Signal
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# модели с изображениями: поле файла и JSON-поле с его вариантами
+IMAGE_FIELDS = {
+    "shopapp.ProductImage": ("image", "image_variants"),
+    "shopapp.Category": ("image", "image_variants"),
+    "myauth.ProfileUser": ("avatar", "avatar_variants"),
+}
+
+# отправляется, когда варианты изображения записаны в базу
+variants_generated = Signal()
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def variant_name(source: str, width: int, extension: str) -> str:
+    path = PurePosixPath(source)
+    return str(path.parent / "variants" / f"{path.stem}.{width}w.{extension}")
+
+
+def save_image(storage, name: str, image: Image.Image, image_format: str) -> str:
+    """Записывает вариант и возвращает его имя в хранилище.
+
+    На диске файл пишется во временный и подменяется через os.replace, поэтому
+    читатели и параллельные потоки видят либо старый, либо новый файл целиком.
+    """
+    buffer = io.BytesIO()
+    if image_format == "JPEG":
+        image = image.convert("RGB")
+        image.save(buffer, image_format, quality=85, optimize=True, progressive=True)
+    elif image_format == "WEBP":
+        image.save(buffer, image_format, quality=80, method=4)
+    else:
+        image.save(buffer, image_format, optimize=True)
+    try:
+        path = Path(storage.path(name))
+    except NotImplementedError:
+        # удаленное хранилище публикует объект только после полной загрузки
+        return storage.save(name, ContentFile(buffer.getvalue()))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=path.parent, prefix=f".{path.name}.", delete=False
+    ) as file:
+        file.write(buffer.getvalue())
+    os.chmod(file.name, getattr(storage, "file_permissions_mode", None) or 0o644)
+    os.replace(file.name, path)
+    return name
+
+
+def generate_variants(field_file: FieldFile) -> dict[str:any]:
+    """Уменьшенные копии изображения по IMAGE_VARIANT_WIDTHS в WebP и в JPEG
+    (PNG для картинок с прозрачностью). Больше оригинала копии не делаются."""
+    storage = field_file.storage
+    with storage.open(field_file.name, "rb") as file:
+        original = ImageOps.exif_transpose(Image.open(file))
+        original.load()
+    transparent = original.mode in ("RGBA", "LA") or "transparency" in original.info
+    if original.mode not in ("RGB", "RGBA"):
+        original = original.convert("RGBA" if transparent else "RGB")
+    fallback = ("PNG", "png") if transparent else ("JPEG", "jpg")
+
+    widths = [
+        width for width in settings.IMAGE_VARIANT_WIDTHS if width < original.width
+    ]
+    items = []
+    for width in widths or [original.width]:
+        height = max(1, round(original.height * width / original.width))
+        resized = original.resize((width, height), Image.LANCZOS)
+        for image_format, extension in (("WEBP", "webp"), fallback):
+            name = save_image(
+                storage,
+                variant_name(field_file.name, width, extension),
+                resized,
+                image_format,
+            )
+            items.append(
+                {
+                    "src": name,
+                    "width": width,
+                    "height": height,
+                    "type": f"image/{image_format.lower()}",
+                }
+            )
+    return {"source": field_file.name, "items": items}
+
+
+def image_data(field_file: FieldFile, variants: dict | None) -> dict[str:any]:
+    """src и alt изображения и его готовые варианты с шириной и высотой"""
+    data = {"src": field_file.url, "alt": field_file.name, "variants": []}
+    if variants and variants.get("source") == field_file.name:
+        data["variants"] = [
+            {**item, "src": field_file.storage.url(item["src"])}
+            for item in variants["items"]
+        ]
+    return data
+
+
+def needs_variants(instance: models.Model) -> bool:
+    field_name, variants_field = IMAGE_FIELDS[instance._meta.label]
+    field_file = getattr(instance, field_name)
+    variants = getattr(instance, variants_field) or {}
+    return bool(field_file) and variants.get("source") != field_file.name
+
+
+def find_variants(source: str) -> dict | None:
+    """готовые варианты того же файла у любой записи: картинки по умолчанию
+    общие у многих записей, и их варианты строятся один раз"""
+    for label, (field_name, variants_field) in IMAGE_FIELDS.items():
+        variants = (
+            apps.get_model(label)
+            .objects.filter(**{field_name: source, f"{variants_field}__source": source})
+            .values_list(variants_field, flat=True)
+            .first()
+        )
+        if variants:
+            return variants
+    return None
+
+
+def delete_variants(storage, variants: dict) -> None:
+    """удаляет файлы вариантов, если на них не ссылается ни одна запись"""
+    source = variants.get("source")
+    for label, (_, variants_field) in IMAGE_FIELDS.items():
+        model = apps.get_model(label)
+        if model.objects.filter(**{f"{variants_field}__source": source}).exists():
+            return
+    for item in variants.get("items", []):
+        storage.delete(item["src"])
+
+
+def update_variants(
+    instance: models.Model, variants: dict | None = None, reuse: bool = True
+) -> bool:
+    """Записывает варианты изображения, если оно за это время не сменилось.
+
+    Варианты берутся готовые (переданные или, при reuse, у другой записи с тем
+    же файлом), иначе строятся. Варианты прежнего изображения удаляются.
+    Возвращает, записаны ли варианты.
+    """
+    model = type(instance)
+    field_name, variants_field = IMAGE_FIELDS[model._meta.label]
+    field_file = getattr(instance, field_name)
+    previous = getattr(instance, variants_field) or {}
+    if variants is None and reuse:
+        variants = find_variants(field_file.name)
+    try:
+        if variants is None:
+            variants = generate_variants(field_file)
+    except (OSError, UnidentifiedImageError):
+        logger.warning(
+            "Не удалось построить варианты %s", field_file.name, exc_info=True
+        )
+        return False
+    updated = model.objects.filter(
+        pk=instance.pk, **{field_name: field_file.name}
+    ).update(**{variants_field: variants})
+    if updated:
+        setattr(instance, variants_field, variants)
+        if previous.get("source") not in (None, field_file.name):
+            delete_variants(field_file.storage, previous)
+        variants_generated.send(sender=model, instance=instance)
+    return bool(updated)
+
+
+def build_variants(label: str, pk: int) -> None:
+    """задача фонового пула: строит варианты изображения одной записи"""
+    try:
+        instance = apps.get_model(label).objects.filter(pk=pk).first()
+        if instance is not None and needs_variants(instance):
+            update_variants(instance)
+    except Exception:
+        logger.exception("Ошибка построения вариантов %s %s", label, pk)
+    finally:
+        if settings.IMAGE_VARIANT_WORKERS:
+            connection.close()
+
+
+def schedule_variants(instance: models.Model) -> None:
+    """после коммита ставит построение вариантов в фоновый пул потоков,
+    при IMAGE_VARIANT_WORKERS = 0 строит их сразу в том же процессе"""
+    label, pk = instance._meta.label, instance.pk
+
+    def submit() -> None:
+        global _executor
+        if not settings.IMAGE_VARIANT_WORKERS:
+            build_variants(label, pk)
+            return
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_WORKERS,
+                thread_name_prefix="image-variants",
+            )
+        _executor.submit(build_variants, label, pk)
+
+    transaction.on_commit(submit)
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import importlib.util
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -52,6 +54,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "backend.compression.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -103,6 +106,29 @@ DATABASES = {
 	}
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# версии пространств ключей (shopapp.cache) и журнал подсказок должны быть
+# общими для всех процессов и контейнеров (web-market и scheduler), поэтому
+# кэш - Redis из REDIS_URL (в docker-compose - сервис redis). Без REDIS_URL
+# кэш в памяти процесса: годится только для одного процесса без scheduler
+
+REDIS_URL = os.environ.get("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -143,6 +169,46 @@ STATIC_ROOT = BASE_DIR / "static"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# хэшированные имена статики по манифесту (app.css -> app.3f2a1b9c8d7e.css),
+# нужен collectstatic; при DEBUG статика отдается из исходников как есть
+STATIC_MANIFEST = not DEBUG
+
+# collectstatic пишет рядом с текстовыми файлами STATIC_ROOT сжатые .gz/.br копии
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": (
+            "backend.staticfiles.CompressedManifestStaticFilesStorage"
+            if STATIC_MANIFEST
+            else "backend.staticfiles.CompressedStaticFilesStorage"
+        ),
+    },
+}
+
+# отдавать собранную статику из STATIC_ROOT самим приложением, выбирая готовую
+# сжатую копию по Accept-Encoding (без runserver и DEBUG)
+SERVE_STATIC = False
+# отдавать MEDIA_ROOT без DEBUG (при DEBUG медиа отдаются всегда)
+SERVE_MEDIA = False
+
+# Cache-Control: хэшированная статика не меняется никогда, остальные файлы
+# кэшируются на указанное число секунд
+STATIC_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+STATIC_MAX_AGE = 60 * 60
+MEDIA_MAX_AGE = 60 * 60 * 24
+
+# префикс internal-локаций nginx, например "/internal": вместо чтения файла
+# приложение отвечает X-Accel-Redirect на /internal/static/... или
+# /internal/media/..., а файл (и Range) отдает nginx:
+#   location /internal/static/ { internal; alias <STATIC_ROOT>/; gzip_static on; }
+#   location /internal/media/ { internal; alias <MEDIA_ROOT>/; }
+ACCEL_REDIRECT_PREFIX = None
+
+# ответы меньше этого размера в байтах не сжимаются
+COMPRESSION_MIN_SIZE = 1024
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -158,5 +224,45 @@ REST_FRAMEWORK = {
         "rest_framework.filters.OrderingFilter",
     ],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
 }
+# MessagePack для внутренних клиентов (Accept: application/msgpack),
+# включается, если установлен пакет msgpack
+if importlib.util.find_spec("msgpack") is not None:
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"].append(
+        "api.renderers.MessagePackRenderer"
+    )
+# сколько секунд хранить дерево категорий: версию сдвигают сигналы после
+# коммита, срок - страховка от устаревших данных, все же попавших в кэш
+CATEGORY_TREE_CACHE_TIMEOUT = 60 * 60
+# каталог: дальше этой страницы постраничный вывод через OFFSET не идет,
+# для глубокого обхода используется курсор (?pagination=cursor)
+CATALOG_MAX_PAGE_NUMBER = 100
+# сколько секунд хранить фасеты каталога, если их не сбросило изменение товаров
+CATALOG_FACETS_CACHE_TIMEOUT = 60 * 10
+# колоночный индекс каталога в памяти (нужен numpy), снимок строится командой
+# rebuild_catalog_index и общий для всех процессов через mmap
+CATALOG_INDEX_ENABLED = False
+CATALOG_INDEX_PATH = BASE_DIR / "var" / "catalog_index"
+# корзина анонимного посетителя хранится в подписанной cookie
+GUEST_BASKET_COOKIE = "basket"
+GUEST_BASKET_COOKIE_AGE = 60 * 60 * 24 * 30
+# предел name=value cookie корзины в байтах (браузеры хранят до 4096 байт
+# на cookie), сверх него добавление в корзину гостя отвечает 400
+GUEST_BASKET_COOKIE_MAX_SIZE = 3800
+
+# сколько изменений позиций принимает пакетное изменение корзины за один запрос
+BASKET_BULK_MAX_ITEMS = 500
+
+# ширины уменьшенных копий изображений (WebP и JPEG/PNG) и число потоков,
+# которые строят их после загрузки; 0 - строить сразу после коммита
+IMAGE_VARIANT_WIDTHS = (200, 400, 800)
+IMAGE_VARIANT_WORKERS = 2
+
+# за сколько дней вес заказа в популярности продукта падает вдвое
+POPULARITY_HALF_LIFE_DAYS = 7
+
 SPECTACULAR_SETTINGS = {"TITLE": "My Django diploma project", "VERSION": "0.0.1"}
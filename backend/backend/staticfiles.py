@@ -0,0 +1,94 @@
+import mimetypes
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage,
+    StaticFilesStorage,
+    staticfiles_storage,
+)
+from django.http import HttpRequest, HttpResponseBase
+from django.utils.cache import patch_vary_headers
+
+from backend.compression import (
+    COMPRESSIBLE_EXTENSIONS,
+    ENCODING_EXTENSIONS,
+    accepted_encodings,
+    compress_file,
+)
+from backend.files import file_response, resolve_path
+
+# имя вида app.3f2a1b9c8d7e.css, которое ManifestStaticFilesStorage дает копии app.css
+HASHED_NAME_RE = re.compile(r"^(?P<name>.+)\.[0-9a-f]{12}(?P<ext>\.[^./]+)?$")
+
+
+class CompressedStaticFilesMixin:
+    """после collectstatic пишет .gz/.br копии всех текстовых файлов STATIC_ROOT"""
+
+    def post_process(self, paths: dict, dry_run: bool = False, **options):
+        parent = getattr(super(), "post_process", None)
+        if parent is not None:
+            yield from parent(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for path in sorted(Path(self.location).rglob("*")):
+            if path.is_file() and path.suffix.lower() in COMPRESSIBLE_EXTENSIONS:
+                compress_file(path)
+
+
+class CompressedStaticFilesStorage(CompressedStaticFilesMixin, StaticFilesStorage):
+    pass
+
+
+class CompressedManifestStaticFilesStorage(
+    CompressedStaticFilesMixin, ManifestStaticFilesStorage
+):
+    """хэшированные имена файлов по манифесту плюс сжатые копии"""
+
+
+def is_hashed_name(path: str) -> bool:
+    """путь - хэшированная копия из манифеста, ее содержимое никогда не меняется"""
+    match = HASHED_NAME_RE.match(path)
+    hashed_files = getattr(staticfiles_storage, "hashed_files", None)
+    if match is None or not hashed_files:
+        return False
+    original = match["name"] + (match["ext"] or "")
+    return hashed_files.get(original) == path
+
+
+def serve_static(request: HttpRequest, path: str) -> HttpResponseBase:
+    """Отдает собранную статику из STATIC_ROOT.
+
+    Если клиент принимает br или gzip и у файла есть готовая сжатая копия,
+    отдается она с Content-Encoding, без сжатия на лету (за nginx с
+    X-Accel-Redirect копию выбирает сам nginx через gzip_static/brotli_static).
+    Хэшированные имена кэшируются навсегда, остальные - на STATIC_MAX_AGE.
+    """
+    fullpath = resolve_path(settings.STATIC_ROOT, path)
+    compressible = fullpath.suffix.lower() in COMPRESSIBLE_EXTENSIONS
+    encoding = None
+    if compressible and not settings.ACCEL_REDIRECT_PREFIX:
+        # готовые копии не требуют пакета brotli, поэтому перебираем все
+        accepted = accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        for candidate, extension in ENCODING_EXTENSIONS.items():
+            compressed = fullpath.with_name(fullpath.name + extension)
+            if candidate in accepted and compressed.is_file():
+                encoding = candidate
+                break
+
+    immutable = is_hashed_name(path)
+    response = file_response(
+        request,
+        compressed if encoding is not None else fullpath,
+        settings.STATIC_URL + path,
+        content_type=mimetypes.guess_type(str(fullpath))[0],
+        encoding=encoding,
+        max_age=(
+            settings.STATIC_IMMUTABLE_MAX_AGE if immutable else settings.STATIC_MAX_AGE
+        ),
+        immutable=immutable,
+    )
+    if compressible:
+        patch_vary_headers(response, ("Accept-Encoding",))
+    return response
@@ -17,9 +17,9 @@ Including another URLconf
 
 import debug_toolbar
 from backend import settings
-from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+from backend.files import serve_media
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -32,4 +32,14 @@ if settings.DEBUG:
         path("__debug__/", include(debug_toolbar.urls)),
     ] + urlpatterns
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+if settings.SERVE_STATIC:
+    from backend.staticfiles import serve_static
+
+    urlpatterns += [
+        re_path(rf"^{settings.STATIC_URL.strip('/')}/(?P<path>.*)$", serve_static),
+    ]
+
+if settings.DEBUG or settings.SERVE_MEDIA:
+    urlpatterns += [
+        re_path(rf"^{settings.MEDIA_URL.strip('/')}/(?P<path>.*)$", serve_media),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("myauth", "0002_alter_profileuser_avatar"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profileuser",
+            name="avatar_variants",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                verbose_name="Варианты аватара",
+            ),
+        ),
+    ]
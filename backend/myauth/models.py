@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from backend.images import image_data
+
 
 def avatar_image_directory_path(instance: "ProfileUser", filename: str) -> str:
     return f"profile/profile_{instance.pk}/avatar/{filename}"
@@ -19,13 +21,15 @@ class ProfileUser(models.Model):
         upload_to=avatar_image_directory_path,
         default="profile/avatar_default.png",
     )
+    avatar_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Варианты аватара",
+    )
 
     def get_avatar(self) -> dict[str: any]:
-        avatar = {
-            "src": self.avatar.url,
-            "alt": self.avatar.name,
-        }
-        return avatar
+        return image_data(self.avatar, self.avatar_variants)
 
     def __str__(self) -> str:
         return f"{self.name}"
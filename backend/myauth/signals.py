@@ -0,0 +1,15 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from backend.images import needs_variants, schedule_variants
+
+from .models import ProfileUser
+
+
+@receiver(post_save, sender=ProfileUser)
+def schedule_avatar_variants(
+    sender, instance: ProfileUser, raw: bool = False, **kwargs
+) -> None:
+    """новый аватар получает уменьшенные копии в фоновом пуле"""
+    if not raw and needs_variants(instance):
+        schedule_variants(instance)
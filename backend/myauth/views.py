@@ -10,6 +10,8 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from shopapp.guest_basket import GuestBasket
+
 from .models import ProfileUser
 from .serializers import ProfileSerializer
 from .forms import ProfileForm
@@ -30,8 +32,11 @@ class SignInAPIView(APIView):
         password: str = data["password"]
         user = authenticate(request, username=username, password=password)
         if user is not None:
+            guest_basket = GuestBasket(request)
             login(request, user)
-            return Response(status=200)
+            response = Response(status=200)
+            guest_basket.merge_into(user, response)
+            return response
         return Response(status=500)
 
 
@@ -51,8 +56,11 @@ class SignUpAPIView(APIView):
         )
 
         if user is not None:
+            guest_basket = GuestBasket(request)
             login(request, user)
-            return Response(status=200)
+            response = Response(status=200)
+            guest_basket.merge_into(user, response)
+            return response
         return Response(status=500)
 
 
@@ -82,10 +90,7 @@ class ProfileUserAPIView(APIView):
             "full_name": f"{profile.surname} {profile.name} {profile.patronymic}",
             "email": profile.email,
             "phone": profile.phone,
-            "avatar": {
-                "src": profile.avatar.url,
-                "alt": profile.avatar.name,
-            },
+            "avatar": profile.get_avatar(),
         }
 
         return JsonResponse(data)
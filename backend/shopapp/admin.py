@@ -40,6 +40,7 @@ class ProductAdmin(admin.ModelAdmin):
     list_display_links = "pk", "title", "price"
     ordering = ("pk",)
     search_fields = ("title",)
+    readonly_fields = ("rating",)
     inlines = [SpecificationInline, ProductImageInline]
 
 
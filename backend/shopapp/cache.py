@@ -0,0 +1,43 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+
+CATALOG = "catalog"
+CATEGORY_TREE = "category_tree"
+HOMEPAGE = "homepage"
+SUGGEST = "suggest"
+
+
+def initial_version() -> int:
+    """версия нового (или вытесненного из кэша) пространства - время в мс,
+    чтобы после потери счетчика не повторились версии, уже попавшие в ETag"""
+    return time.time_ns() // 1_000_000
+
+
+def get_version(namespace: str) -> int:
+    """текущая версия пространства ключей кэша"""
+    key = f"version:{namespace}"
+    version = cache.get(key)
+    if version is None:
+        version = initial_version()
+        cache.add(key, version, timeout=None)
+        version = cache.get(key, version)
+    return version
+
+
+def bump_version(namespace: str) -> int | None:
+    """делает недействительными все ключи пространства, увеличивая его версию;
+    возвращает новую версию, если она известна точно"""
+    key = f"version:{namespace}"
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = initial_version()
+        return version if cache.add(key, version, timeout=None) else None
+
+
+def make_key(namespace: str, *parts: object) -> str:
+    """ключ кэша с версией пространства, части ключа сворачиваются в хэш"""
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f"{namespace}:{get_version(namespace)}:{digest}"
@@ -0,0 +1,343 @@
+import fcntl
+import json
+import os
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from .models import Product
+
+PRODUCT_DTYPE = [
+    ("id", "i8"),
+    ("price", "f8"),
+    ("rating", "f8"),
+    ("rating_count", "i8"),
+    ("date", "i8"),
+    ("count", "i8"),
+    ("category_id", "i8"),
+    ("lft", "i8"),
+    ("rght", "i8"),
+    ("tree_id", "i8"),
+    ("free_delivery", "?"),
+    ("title_rank", "i8"),
+]
+
+# поля сортировки каталога, которые индекс умеет сортировать сам
+SORT_COLUMNS = {
+    "id": "id",
+    "effective_price": "price",
+    "rating": "rating",
+    "rating_count": "rating_count",
+    "date": "date",
+    "count": "count",
+    "title": "title_rank",
+    "free_delivery": "free_delivery",
+    "category_id": "category_id",
+}
+
+PRODUCT_COLUMNS = (
+    "id",
+    "effective_price",
+    "rating",
+    "rating_count",
+    "date",
+    "count",
+    "category_id",
+    "category__lft",
+    "category__rght",
+    "category__tree_id",
+    "free_delivery",
+)
+
+
+class CatalogIndex:
+    """Колоночный индекс каталога в памяти для фильтрации, сортировки и пагинации.
+
+    Колонки продуктов хранятся структурированным массивом NumPy, теги -
+    битовыми масками (по столбцу на тег). Снимок пишется в CATALOG_INDEX_PATH
+    и открывается через mmap, поэтому все процессы сервера делят одну копию
+    в page cache. Запрос каталога превращается в список id страницы, ORM
+    загружает только эти продукты.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.generation = None
+        self.products = None
+        self.tag_bits = None
+        self.tag_columns: dict[str, int] = {}
+
+    @property
+    def meta_path(self) -> Path:
+        return self.path / "meta.json"
+
+    # --- сборка и запись снимка ---
+
+    @staticmethod
+    def read_rows(product_ids: list[int] | None = None) -> tuple:
+        products = Product.objects.order_by("id")
+        links = Product.tags.through.objects.order_by()
+        if product_ids is not None:
+            products = products.filter(pk__in=product_ids)
+            links = links.filter(product_id__in=product_ids)
+        rows = list(products.values_list(*PRODUCT_COLUMNS))
+        tags = list(links.values_list("product_id", "tag__name"))
+        return rows, tags
+
+    @staticmethod
+    def to_array(rows: list[tuple]) -> "np.ndarray":
+        array = np.zeros(len(rows), dtype=PRODUCT_DTYPE)
+        for i, row in enumerate(rows):
+            pk, price, rating, rating_count, date, *rest = row
+            array[i] = (
+                pk,
+                float(price),
+                float(rating),
+                rating_count,
+                int(date.timestamp() * 1_000_000),
+                *rest,
+                0,
+            )
+        return array
+
+    @staticmethod
+    def rank_titles(array: "np.ndarray") -> None:
+        """ранг названия в порядке сортировки базы, достаточно одного запроса id"""
+        ordered_ids = Product.objects.order_by("title", "id").values_list(
+            "id", flat=True
+        )
+        ranks = {pk: rank for rank, pk in enumerate(ordered_ids)}
+        array["title_rank"] = [ranks.get(pk, len(ranks)) for pk in array["id"].tolist()]
+
+    def write(
+        self, array: "np.ndarray", tag_matrix: "np.ndarray", tags: list[str]
+    ) -> None:
+        """пишет новое поколение снимка и атомарно переключает на него meta.json"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        generation = (self.read_meta() or {}).get("generation", 0) + 1
+        np.save(self.path / f"products.{generation}.npy", array)
+        np.save(self.path / f"tags.{generation}.npy", np.packbits(tag_matrix, axis=0))
+        temp_meta = self.path / f"meta.{generation}.tmp"
+        temp_meta.write_text(
+            json.dumps({"generation": generation, "size": len(array), "tags": tags})
+        )
+        os.replace(temp_meta, self.meta_path)
+        for old in self.path.glob("*.npy"):
+            if not old.name.endswith(f".{generation}.npy"):
+                old.unlink(missing_ok=True)
+
+    def rebuild(self) -> None:
+        """полностью перестраивает снимок по базе"""
+        rows, links = self.read_rows()
+        array = self.to_array(rows)
+        self.rank_titles(array)
+        tags = sorted({name for _, name in links})
+        tag_matrix = self.tag_matrix(array["id"], links, tags)
+        with self.file_lock():
+            self.write(array, tag_matrix, tags)
+
+    @staticmethod
+    def tag_matrix(
+        ids: "np.ndarray", links: list[tuple], tags: list[str]
+    ) -> "np.ndarray":
+        matrix = np.zeros((len(ids), len(tags)), dtype=bool)
+        rows = {pk: i for i, pk in enumerate(ids.tolist())}
+        columns = {name: i for i, name in enumerate(tags)}
+        for product_id, name in links:
+            if product_id in rows:
+                matrix[rows[product_id], columns[name]] = True
+        return matrix
+
+    def refresh(self, product_ids: list[int], titles_changed: bool = False) -> None:
+        """Переносит в снимок изменения нескольких продуктов.
+
+        Если продукты не добавились и не удалились и новых тегов нет, строки
+        меняются в копии текущего поколения без чтения всего каталога из базы.
+        Ранги названий пересчитываются (запросом по всему каталогу), только
+        если названия менялись.
+        """
+        with self.file_lock():
+            if not self.load():
+                return
+            rows, links = self.read_rows(product_ids)
+            changed = self.to_array(rows)
+            ids = self.products["id"]
+            positions = np.searchsorted(ids, changed["id"])
+            present = positions < len(ids)
+            present[present] = ids[positions[present]] == changed["id"][present]
+            removed = np.isin(ids, product_ids) & ~np.isin(ids, changed["id"])
+            new_tags = {name for _, name in links} - set(self.tag_columns)
+            if present.all() and not removed.any() and not new_tags:
+                self.patch(positions, changed, links, titles_changed)
+            else:
+                self.replace(product_ids, changed, links)
+
+    def patch(
+        self,
+        positions: "np.ndarray",
+        changed: "np.ndarray",
+        links: list[tuple],
+        titles_changed: bool,
+    ) -> None:
+        """Пишет новое поколение с замененными строками продуктов и битами тегов.
+
+        Файлы текущего поколения не меняются: читатели без блокировки видят
+        через mmap старый или новый снимок целиком, а не наполовину
+        записанную строку.
+        """
+        tags = list(self.tag_columns)
+        products = np.array(self.products)
+        tag_matrix = self.unpacked_tags()
+        changed["title_rank"] = products["title_rank"][positions]
+        products[positions] = changed
+        tag_matrix[positions] = self.tag_matrix(changed["id"], links, tags)
+        if titles_changed:
+            self.rank_titles(products)
+        self.write(products, tag_matrix, tags)
+
+    def replace(
+        self, product_ids: list[int], changed: "np.ndarray", links: list[tuple]
+    ) -> None:
+        """пишет новое поколение без удаленных и с добавленными продуктами"""
+        keep = ~np.isin(self.products["id"], product_ids)
+        tags = sorted(set(self.tag_columns) | {name for _, name in links})
+
+        kept_tags = self.unpacked_tags()[keep]
+        matrix = np.zeros((len(kept_tags), len(tags)), dtype=bool)
+        for name, column in self.tag_columns.items():
+            matrix[:, tags.index(name)] = kept_tags[:, column]
+
+        array = np.concatenate([np.array(self.products[keep]), changed])
+        matrix = np.concatenate([matrix, self.tag_matrix(changed["id"], links, tags)])
+        order = np.argsort(array["id"], kind="stable")
+        array, matrix = array[order], matrix[order]
+        self.rank_titles(array)
+        self.write(array, matrix, tags)
+
+    def file_lock(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        return _FileLock(self.path / "lock")
+
+    # --- чтение снимка ---
+
+    def read_meta(self) -> dict | None:
+        try:
+            return json.loads(self.meta_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def load(self) -> bool:
+        """подключает последнее поколение снимка, если оно сменилось"""
+        meta = self.read_meta()
+        if meta is None:
+            return False
+        if meta["generation"] == self.generation:
+            return True
+        generation = meta["generation"]
+        try:
+            products = np.load(self.path / f"products.{generation}.npy", mmap_mode="r")
+            tag_bits = np.load(self.path / f"tags.{generation}.npy", mmap_mode="r")
+        except FileNotFoundError:
+            return False
+        with self.lock:
+            self.products = products
+            self.tag_bits = tag_bits
+            self.tag_columns = {name: i for i, name in enumerate(meta["tags"])}
+            self.generation = generation
+        return True
+
+    def unpacked_tags(self) -> "np.ndarray":
+        size = len(self.products)
+        if not self.tag_columns:
+            return np.zeros((size, 0), dtype=bool)
+        return np.unpackbits(self.tag_bits, axis=0, count=size).astype(bool)
+
+    def tag_mask(self, name: str) -> "np.ndarray":
+        column = self.tag_columns.get(name)
+        if column is None:
+            return np.zeros(len(self.products), dtype=bool)
+        bits = np.unpackbits(self.tag_bits[:, column], count=len(self.products))
+        return bits.astype(bool)
+
+    def supports(self, sort_field: str) -> bool:
+        return sort_field in SORT_COLUMNS
+
+    def resolve(
+        self,
+        filters: dict[str:any],
+        sort_field: str,
+        descending: bool,
+        offset: int,
+        limit: int,
+    ) -> tuple[list[int], int] | None:
+        """id продуктов страницы и общее число найденных, None если снимка нет"""
+        if not self.load():
+            return None
+        with self.lock:
+            products = self.products
+            mask = np.ones(len(products), dtype=bool)
+            if filters["category_id"]:
+                if filters["category_bounds"] is None:
+                    return [], 0
+                tree_id, lft, rght = filters["category_bounds"]
+                mask &= products["tree_id"] == tree_id
+                mask &= (products["lft"] >= lft) & (products["rght"] <= rght)
+            if filters["min_price"] is not None:
+                mask &= products["price"] >= filters["min_price"]
+            if filters["max_price"] is not None:
+                mask &= products["price"] <= filters["max_price"]
+            if filters["free_delivery"]:
+                mask &= products["free_delivery"]
+            if filters["available"]:
+                mask &= products["count"] > 0
+            for tag in filters["tags"]:
+                mask &= self.tag_mask(tag)
+
+            positions = np.flatnonzero(mask)
+            keys = products[SORT_COLUMNS[sort_field]][positions]
+            order = np.lexsort((products["id"][positions], keys))
+            if descending:
+                order = order[::-1]
+            page = positions[order[offset : offset + limit]]
+            return products["id"][page].tolist(), len(positions)
+
+
+class _FileLock:
+    """межпроцессная блокировка снимка на время перезаписи"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.file = None
+
+    def __enter__(self) -> "_FileLock":
+        self.file = open(self.path, "w")
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+_catalog_index: CatalogIndex | None = None
+
+
+def get_catalog_index() -> CatalogIndex | None:
+    """индекс каталога процесса или None, если он выключен в настройках"""
+    global _catalog_index
+    if not settings.CATALOG_INDEX_ENABLED:
+        return None
+    if np is None:
+        raise ImproperlyConfigured("Для CATALOG_INDEX_ENABLED нужен пакет numpy")
+    path = Path(settings.CATALOG_INDEX_PATH)
+    if _catalog_index is None or _catalog_index.path != path:
+        _catalog_index = CatalogIndex(path)
+    return _catalog_index
@@ -0,0 +1,64 @@
+import hashlib
+from datetime import datetime
+
+from django.http import HttpRequest
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
+from rest_framework.request import Request
+
+from .cache import get_version
+from .models import Product
+
+
+class VersionsState:
+    """ETag списка по версиям пространств кэша, из которых он строится.
+
+    Версии увеличивают сигналы при любом изменении данных списка (и удалении
+    тоже), поэтому ETag получается без запросов к базе, и на If-None-Match
+    можно ответить 304 до запуска сериализатора. Ответ зависит еще от
+    параметров запроса и выбранного рендерера, они тоже входят в ETag.
+    Last-Modified для списков не отдается.
+    """
+
+    def __init__(self, *namespaces: str) -> None:
+        self.namespaces = namespaces
+
+    def etag(self, request: Request, *args, **kwargs) -> str:
+        state = [(namespace, get_version(namespace)) for namespace in self.namespaces]
+        # рендерер DRF выбирает в initial() до вызова get
+        media_type = getattr(request, "accepted_media_type", None)
+        params = sorted(request.GET.lists())
+        return hashlib.md5(repr((state, media_type, params)).encode()).hexdigest()
+
+    def decorator(self):
+        """декоратор класса APIView, добавляющий условную обработку в get"""
+        return method_decorator(
+            [vary_on_headers("Accept"), condition(etag_func=self.etag)], name="get"
+        )
+
+
+def product_last_modified(
+    request: HttpRequest, product_id: int, *args, **kwargs
+) -> datetime | None:
+    """updated_at продукта, запоминается в запросе для product_etag"""
+    if not hasattr(request, "_product_updated_at"):
+        request._product_updated_at = (
+            Product.objects.filter(pk=product_id)
+            .values_list("updated_at", flat=True)
+            .first()
+        )
+    return request._product_updated_at
+
+
+def product_etag(request: HttpRequest, product_id: int, *args, **kwargs) -> str | None:
+    updated_at = product_last_modified(request, product_id)
+    if updated_at is None:
+        return None
+    return f"{product_id}-{updated_at.timestamp()}"
+
+
+product_condition = method_decorator(
+    condition(etag_func=product_etag, last_modified_func=product_last_modified),
+    name="get",
+)
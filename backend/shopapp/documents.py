@@ -0,0 +1,95 @@
+import json
+from functools import cached_property
+
+from django.http import HttpRequest, HttpResponse
+from rest_framework.response import Response
+
+from api.renderers import ORJSONRenderer
+
+from .models import Product, ProductDocument
+from .serializers import ProductSerializer, ProductShortSerializer
+
+
+def render(data: object) -> str:
+    """JSON в том же виде, в каком его отдал бы Response с JSONRenderer"""
+    return ORJSONRenderer().render(data).decode()
+
+
+def refresh_documents(product_ids: list[int] | None = None) -> list[ProductDocument]:
+    """перестраивает документы продуктов, None - всех продуктов"""
+    cards = Product.objects.for_list()
+    details = Product.objects.for_serializer()
+    if product_ids is not None:
+        cards = cards.filter(pk__in=product_ids)
+        details = details.filter(pk__in=product_ids)
+    cards_by_id = {product.pk: product for product in cards}
+    documents = [
+        ProductDocument(
+            product_id=product.pk,
+            card=render(ProductShortSerializer(cards_by_id[product.pk]).data),
+            detail=render(ProductSerializer(product).data),
+        )
+        for product in details
+        if product.pk in cards_by_id
+    ]
+    ProductDocument.objects.bulk_create(
+        documents,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=["product"],
+        update_fields=["card", "detail", "updated_at"],
+    )
+    return documents
+
+
+def get_documents(product_ids: list[int], field: str) -> list[str]:
+    """документы продуктов в порядке product_ids, недостающие строятся на лету"""
+    stored = dict(
+        ProductDocument.objects.filter(product_id__in=product_ids).values_list(
+            "product_id", field
+        )
+    )
+    missing = [pk for pk in product_ids if pk not in stored]
+    if missing:
+        for document in refresh_documents(missing):
+            stored[document.product_id] = getattr(document, field)
+    return [stored[pk] for pk in product_ids if pk in stored]
+
+
+class DocumentResponse(HttpResponse):
+    """JSON-ответ, склеенный из готовых документов без повторной сериализации.
+
+    items - список документов, остальные поля ответа рендерятся как обычно.
+    data разбирает тело ответа, как у Response, для тестов и отладки.
+    """
+
+    def __init__(
+        self, document: str | None = None, items: list[str] | None = None, **fields
+    ) -> None:
+        if document is None:
+            rendered = render(fields)
+            document = "{" + f'"items":[{",".join(items or [])}]'
+            if fields:
+                document += "," + rendered[1:]
+            else:
+                document += "}"
+        super().__init__(document, content_type="application/json")
+
+    @cached_property
+    def data(self) -> object:
+        return json.loads(self.content)
+
+
+def document_response(
+    request: HttpRequest,
+    document: str | None = None,
+    items: list[str] | None = None,
+    **fields,
+) -> HttpResponse:
+    """DocumentResponse, если клиент принимает JSON; для других форматов
+    (MessagePack, браузерный API) - обычный Response из разобранного документа"""
+    response = DocumentResponse(document, items, **fields)
+    renderer = getattr(request, "accepted_renderer", None)
+    if renderer is None or renderer.format == "json":
+        return response
+    return Response(response.data)
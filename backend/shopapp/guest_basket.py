@@ -0,0 +1,137 @@
+import json
+from decimal import Decimal
+from http.cookies import SimpleCookie
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.http import HttpRequest, HttpResponseBase
+
+from .models import Basket, BasketItem, DeliveryPrice, Product
+
+
+class GuestBasket:
+    """Корзина неавторизованного пользователя в подписанной cookie.
+
+    Хранит только {id продукта: количество}, поэтому анонимные посетители не
+    создают ни строк Basket/BasketItem, ни записей сессий. При входе или
+    регистрации позиции сливаются в корзину пользователя одной записью.
+    """
+
+    salt = "shopapp.guest_basket"
+
+    def __init__(self, request: HttpRequest) -> None:
+        self.quantities = self.load(request)
+        self.changed = False
+
+    @classmethod
+    def load(cls, request: HttpRequest) -> dict[int, int]:
+        raw = request.get_signed_cookie(
+            settings.GUEST_BASKET_COOKIE,
+            default=None,
+            salt=cls.salt,
+            max_age=settings.GUEST_BASKET_COOKIE_AGE,
+        )
+        try:
+            quantities = {int(pk): int(count) for pk, count in json.loads(raw).items()}
+        except (TypeError, ValueError, AttributeError):
+            return {}
+        return {pk: count for pk, count in quantities.items() if count > 0}
+
+    def add(self, product_id: int, count: int) -> bool:
+        """добавляет count штук, если на складе хватает на все количество"""
+        stock = (
+            Product.objects.filter(pk=product_id)
+            .values_list("count", flat=True)
+            .first()
+        )
+        quantity = self.quantities.get(product_id, 0) + count
+        if stock is None or quantity > stock:
+            return False
+        self.quantities[product_id] = quantity
+        self.changed = True
+        return True
+
+    def remove(self, product_id: int, count: int) -> bool:
+        """уменьшает позицию на count штук или удаляет ее"""
+        if product_id not in self.quantities:
+            return False
+        quantity = self.quantities[product_id] - count
+        if quantity > 0:
+            self.quantities[product_id] = quantity
+        else:
+            del self.quantities[product_id]
+        self.changed = True
+        return True
+
+    def get_items(self, product_id: int | None = None) -> list[BasketItem]:
+        """несохраненные позиции с продуктами для BasketItemSerializer"""
+        product_ids = list(self.quantities)
+        if product_id is not None:
+            product_ids = [product_id] if product_id in self.quantities else []
+        products = Product.objects.for_list().filter(pk__in=product_ids).order_by("pk")
+        return [
+            BasketItem(product=product, quantity=self.quantities[product.pk])
+            for product in products
+        ]
+
+    def get_totals(self) -> dict[str:any]:
+        prices = dict(
+            Product.objects.filter(pk__in=self.quantities).values_list(
+                "pk", "effective_price"
+            )
+        )
+        return {
+            "count": sum(self.quantities[pk] for pk in prices),
+            "positions": len(prices),
+            "totalCost": sum(
+                (price * self.quantities[pk] for pk, price in prices.items()),
+                Decimal(0),
+            ),
+        }
+
+    def get_summary(self, delivery_type: str = "delivery") -> dict[str:any]:
+        return DeliveryPrice.summarize(
+            self.get_totals(), DeliveryPrice.get_rules(), delivery_type
+        )
+
+    def dumps(self) -> str:
+        return json.dumps(self.quantities, separators=(",", ":"))
+
+    def cookie_size(self) -> int:
+        """размер name=value cookie, как ее запишет set_signed_cookie"""
+        name = settings.GUEST_BASKET_COOKIE
+        signer = signing.get_cookie_signer(salt=name + self.salt)
+        cookie = SimpleCookie()
+        cookie[name] = signer.sign(self.dumps())
+        return len(name) + 1 + len(cookie[name].coded_value)
+
+    def fits(self) -> bool:
+        """браузеры молча отбрасывают cookie больше 4 КБ, а с ней и всю корзину"""
+        return self.cookie_size() <= settings.GUEST_BASKET_COOKIE_MAX_SIZE
+
+    def save(self, response: HttpResponseBase) -> None:
+        """записывает изменения в cookie ответа"""
+        if not self.changed:
+            return
+        if not self.quantities:
+            response.delete_cookie(settings.GUEST_BASKET_COOKIE)
+            return
+        response.set_signed_cookie(
+            settings.GUEST_BASKET_COOKIE,
+            self.dumps(),
+            salt=self.salt,
+            max_age=settings.GUEST_BASKET_COOKIE_AGE,
+            httponly=True,
+            samesite="Lax",
+        )
+
+    def merge_into(self, user: User, response: HttpResponseBase) -> None:
+        """переносит позиции в корзину пользователя и очищает cookie"""
+        if not self.quantities:
+            return
+        basket, created = Basket.objects.get_or_create(user=user)
+        basket.merge_items(self.quantities)
+        self.quantities = {}
+        self.changed = True
+        self.save(response)
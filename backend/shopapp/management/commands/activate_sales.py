@@ -0,0 +1,55 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from shopapp.cache import CATALOG, HOMEPAGE, bump_version
+from shopapp.catalog_index import get_catalog_index
+from shopapp.documents import refresh_documents
+from shopapp.models import Product
+
+
+def seconds_until_midnight() -> float:
+    """секунд до начала следующего дня по TIME_ZONE, когда скидки сменяются"""
+    now = timezone.localtime()
+    midnight = datetime.datetime.combine(
+        now.date() + datetime.timedelta(days=1), datetime.time.min, now.tzinfo
+    )
+    return (midnight - now).total_seconds() + 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает цены с учетом скидок у продуктов, чьи скидки начались "
+        "или закончились. С --forever повторяет пересчет после каждой полуночи"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--forever",
+            action="store_true",
+            help="не завершаться, пересчитывать цены сразу после полуночи",
+        )
+
+    def handle(self, *args, forever: bool = False, **options) -> None:
+        self.activate_sales()
+        while forever:
+            # соединение не держим открытым до следующего дня
+            connection.close()
+            time.sleep(seconds_until_midnight())
+            self.activate_sales()
+
+    def activate_sales(self) -> None:
+        changed = Product.sync_effective_prices()
+        if changed:
+            bump_version(CATALOG)
+            bump_version(HOMEPAGE)
+            refresh_documents(changed)
+            catalog_index = get_catalog_index()
+            if catalog_index is not None:
+                catalog_index.refresh(changed)
+        self.stdout.write(
+            self.style.SUCCESS(f"Обновлены цены продуктов: {len(changed)}")
+        )
@@ -0,0 +1,53 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from api.renderers import MessagePackRenderer, ORJSONRenderer, msgpack, orjson
+from shopapp.models import Product
+from shopapp.serializers import ProductSerializer, ProductShortSerializer
+
+
+class Command(BaseCommand):
+    help = "Сравнивает скорость рендереров API на данных каталога и страниц продуктов"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--limit", type=int, default=20, help="продуктов в выборке")
+        parser.add_argument("--number", type=int, default=200, help="повторов замера")
+
+    def handle(self, *args, **options) -> None:
+        limit, number = options["limit"], options["number"]
+        payloads = {
+            "каталог": {
+                "items": ProductShortSerializer(
+                    Product.objects.for_list().order_by("id")[:limit], many=True
+                ).data,
+                "currentPage": 1,
+                "lastPage": 1,
+            },
+            "продукты": ProductSerializer(
+                Product.objects.for_serializer().order_by("id")[:limit], many=True
+            ).data,
+        }
+        renderers = {"JSONRenderer": JSONRenderer()}
+        if orjson is not None:
+            renderers["ORJSONRenderer"] = ORJSONRenderer()
+        if msgpack is not None:
+            renderers["MessagePackRenderer"] = MessagePackRenderer()
+
+        for name, data in payloads.items():
+            self.stdout.write(f"{name}:")
+            baseline = None
+            for renderer_name, renderer in renderers.items():
+                size = len(renderer.render(data))
+                seconds = min(
+                    timeit.repeat(
+                        lambda: renderer.render(data), number=number, repeat=3
+                    )
+                )
+                per_call = seconds / number * 1_000_000
+                baseline = baseline or per_call
+                self.stdout.write(
+                    f"  {renderer_name:<20} {per_call:10.1f} мкс "
+                    f"x{baseline / per_call:5.2f} {size:>9} байт"
+                )
@@ -0,0 +1,38 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from backend.images import IMAGE_FIELDS, needs_variants, update_variants
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит уменьшенные копии изображений продуктов, категорий и аватаров, "
+        "у которых их еще нет"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--force", action="store_true", help="перестроить и готовые варианты"
+        )
+
+    def handle(self, *args, **options) -> None:
+        # картинки по умолчанию общие у многих записей, их варианты строятся один раз
+        generated: dict[str, dict] = {}
+        for label, (field_name, variants_field) in IMAGE_FIELDS.items():
+            model = apps.get_model(label)
+            built = 0
+            for instance in model.objects.order_by("pk").iterator():
+                field_file = getattr(instance, field_name)
+                if not field_file or not (options["force"] or needs_variants(instance)):
+                    continue
+                name = field_file.name
+                if update_variants(
+                    instance, generated.get(name), reuse=not options["force"]
+                ):
+                    generated[name] = getattr(instance, variants_field)
+                    built += 1
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{model._meta.verbose_name_plural}: построены варианты {built}"
+                )
+            )
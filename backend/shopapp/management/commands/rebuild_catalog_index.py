@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shopapp import catalog_index
+
+
+class Command(BaseCommand):
+    help = "Строит снимок колоночного индекса каталога в CATALOG_INDEX_PATH"
+
+    def handle(self, *args, **options) -> None:
+        if catalog_index.np is None:
+            raise CommandError("Для индекса каталога нужен пакет numpy")
+        catalog_index.CatalogIndex(settings.CATALOG_INDEX_PATH).rebuild()
+        self.stdout.write(self.style.SUCCESS("Индекс каталога перестроен"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from shopapp.documents import refresh_documents
+
+
+class Command(BaseCommand):
+    help = "Перестраивает готовые JSON-документы карточек и страниц всех продуктов"
+
+    def handle(self, *args, **options) -> None:
+        documents = refresh_documents()
+        self.stdout.write(
+            self.style.SUCCESS(f"Перестроено документов продуктов: {len(documents)}")
+        )
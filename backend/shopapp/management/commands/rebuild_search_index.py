@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shopapp.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Перестраивает поисковые документы всех продуктов"
+
+    def handle(self, *args, **options) -> None:
+        get_search_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS("Поисковый индекс перестроен"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from shopapp.models import Product
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счетчик оплаченных заказов и популярность продуктов"
+
+    def handle(self, *args, **options) -> None:
+        updated = Product.recalculate_popularity()
+        self.stdout.write(
+            self.style.SUCCESS(f"Пересчитана популярность продуктов: {updated}")
+        )
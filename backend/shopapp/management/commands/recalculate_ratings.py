@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from shopapp.cache import CATALOG, HOMEPAGE, bump_version
+from shopapp.catalog_index import get_catalog_index
+from shopapp.documents import refresh_documents
+from shopapp.models import Product
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает сумму и количество оценок и рейтинг продуктов по отзывам"
+
+    def handle(self, *args, **options) -> None:
+        changed = Product.recalculate_ratings()
+        if changed:
+            bump_version(CATALOG)
+            bump_version(HOMEPAGE)
+            refresh_documents(changed)
+            catalog_index = get_catalog_index()
+            if catalog_index is not None:
+                catalog_index.refresh(changed)
+        self.stdout.write(
+            self.style.SUCCESS(f"Пересчитан рейтинг продуктов: {len(changed)}")
+        )
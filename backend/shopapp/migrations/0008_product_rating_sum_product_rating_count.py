@@ -0,0 +1,65 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:30
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import (
+    Case,
+    Count,
+    Exists,
+    FloatField,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce
+
+
+def backfill_ratings(apps, schema_editor):
+    Product = apps.get_model("shopapp", "Product")
+    Review = apps.get_model("shopapp", "Review")
+    reviews = Review.objects.filter(product=OuterRef("pk")).order_by().values("product")
+    rating_sum = Coalesce(
+        Subquery(reviews.annotate(total=Sum("rate")).values("total")), 0
+    )
+    rating_count = Coalesce(
+        Subquery(reviews.annotate(total=Count("id")).values("total")), 0
+    )
+    Product.objects.update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating=Case(
+            When(~Exists(reviews), then=Value(Decimal(0))),
+            default=Cast(
+                Cast(rating_sum, FloatField()) / rating_count,
+                models.DecimalField(max_digits=3, decimal_places=2),
+            ),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0007_rename_delivery_address_order_address_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="rating_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Количество оценок"
+            ),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_sum",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Сумма оценок"
+            ),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:34
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+FILL_SEARCH_VECTOR_SQL = """
+UPDATE shopapp_product AS p SET search_vector =
+    setweight(to_tsvector('russian', coalesce(p.title, '')), 'A')
+    || setweight(to_tsvector('russian', coalesce((
+        SELECT string_agg(t.name, ' ')
+        FROM shopapp_product_tags AS pt JOIN shopapp_tag AS t ON t.id = pt.tag_id
+        WHERE pt.product_id = p.id
+    ), '')), 'B')
+    || setweight(to_tsvector('russian', coalesce((
+        SELECT string_agg(coalesce(s.name, '') || ' ' || coalesce(s.value, ''), ' ')
+        FROM shopapp_specification AS s
+        WHERE s.product_id = p.id
+    ), '')), 'C')
+    || setweight(to_tsvector('russian', coalesce(p.description, '')), 'D')
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "CREATE INDEX shopapp_product_search_vector_gin "
+        "ON shopapp_product USING gin (search_vector)"
+    )
+    schema_editor.execute(FILL_SEARCH_VECTOR_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS shopapp_product_search_vector_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0008_product_rating_sum_product_rating_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True, verbose_name="Поисковый документ"
+            ),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
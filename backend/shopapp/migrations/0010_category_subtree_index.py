@@ -0,0 +1,19 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0009_product_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="category",
+            index=models.Index(
+                fields=["tree_id", "lft", "rght"], name="shopapp_category_subtree"
+            ),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0010_category_subtree_index"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="product",
+            options={"verbose_name": "Продукт", "verbose_name_plural": "Продукты"},
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["price", "id"], name="shopapp_product_price"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["rating", "id"], name="shopapp_product_rating"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["rating_count", "id"], name="shopapp_product_reviews"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["date", "id"], name="shopapp_product_date"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["title", "id"], name="shopapp_product_title"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["count", "id"], name="shopapp_product_count"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["category", "price", "id"],
+                name="shopapp_product_category_price",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("count__gt", 0)),
+                fields=["price", "id"],
+                name="shopapp_product_instock_price",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("count__gt", 0)),
+                fields=["rating", "id"],
+                name="shopapp_product_instock_rating",
+            ),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:44
+
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+
+POPULARITY_EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def backfill_popularity(apps, schema_editor):
+    Product = apps.get_model("shopapp", "Product")
+    Order = apps.get_model("shopapp", "Order")
+    orders_count = defaultdict(int)
+    popularity = defaultdict(float)
+    ordered = Order.products.through.objects.filter(
+        order__status="paid"
+    ).values_list("product_id", "order__created_at")
+    for product_id, created_at in ordered.iterator():
+        days = (created_at - POPULARITY_EPOCH).total_seconds() / 86400
+        orders_count[product_id] += 1
+        popularity[product_id] += 2 ** (days / settings.POPULARITY_HALF_LIFE_DAYS)
+    Product.objects.bulk_update(
+        [
+            Product(pk=pk, orders_count=count, popularity=popularity[pk])
+            for pk, count in orders_count.items()
+        ],
+        ["orders_count", "popularity"],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0011_product_sort_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="orders_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Количество оплаченных заказов"
+            ),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="popularity",
+            field=models.FloatField(
+                default=0, editable=False, verbose_name="Популярность"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["popularity", "id"], name="shopapp_product_popularity"
+            ),
+        ),
+        migrations.RunPython(backfill_popularity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0012_product_orders_count_popularity"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(
+                fields=["date_to", "date_from"], name="shopapp_sale_active_range"
+            ),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:46
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+
+def backfill_effective_price(apps, schema_editor):
+    Product = apps.get_model("shopapp", "Product")
+    Sale = apps.get_model("shopapp", "Sale")
+    today = timezone.localdate()
+    discount = Sale.objects.filter(
+        product=OuterRef("pk"), date_from__lte=today, date_to__gte=today
+    ).values("discount")
+    Product.objects.update(
+        effective_price=Greatest(
+            F("price") - Coalesce(Subquery(discount), Value(Decimal(0))),
+            Value(Decimal(0)),
+            output_field=models.DecimalField(max_digits=8, decimal_places=2),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0013_sale_active_range"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="product",
+            name="shopapp_product_price",
+        ),
+        migrations.RemoveIndex(
+            model_name="product",
+            name="shopapp_product_category_price",
+        ),
+        migrations.RemoveIndex(
+            model_name="product",
+            name="shopapp_product_instock_price",
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="effective_price",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                editable=False,
+                max_digits=8,
+                verbose_name="Цена с учетом скидки",
+            ),
+        ),
+        migrations.RunPython(backfill_effective_price, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["effective_price", "id"], name="shopapp_product_price"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["category", "effective_price", "id"],
+                name="shopapp_product_category_price",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("count__gt", 0)),
+                fields=["effective_price", "id"],
+                name="shopapp_product_instock_price",
+            ),
+        ),
+    ]
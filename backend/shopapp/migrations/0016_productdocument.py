@@ -0,0 +1,40 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0015_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductDocument",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="document",
+                        serialize=False,
+                        to="shopapp.product",
+                        verbose_name="Продукт",
+                    ),
+                ),
+                ("card", models.TextField(verbose_name="JSON карточки")),
+                ("detail", models.TextField(verbose_name="JSON детальной страницы")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Дата изменения"),
+                ),
+            ],
+            options={
+                "verbose_name": "Документ продукта",
+                "verbose_name_plural": "Документы продуктов",
+            },
+        ),
+    ]
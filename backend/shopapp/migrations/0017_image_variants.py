@@ -0,0 +1,33 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0016_productdocument"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="image_variants",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                verbose_name="Варианты изображения",
+            ),
+        ),
+        migrations.AddField(
+            model_name="productimage",
+            name="image_variants",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                verbose_name="Варианты изображения",
+            ),
+        ),
+    ]
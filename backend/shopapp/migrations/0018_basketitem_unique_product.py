@@ -0,0 +1,38 @@
+# Generated by Django 4.2.5 on 2026-10-18 12:00
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_items(apps, schema_editor):
+    """сливает повторяющиеся позиции корзины в одну с суммарным количеством"""
+    BasketItem = apps.get_model("shopapp", "BasketItem")
+    duplicates = (
+        BasketItem.objects.values("basket_id", "product_id")
+        .annotate(quantity_sum=Sum("quantity"), first_id=Min("id"), items=Count("id"))
+        .filter(items__gt=1)
+        .order_by()
+    )
+    for row in duplicates:
+        items = BasketItem.objects.filter(
+            basket_id=row["basket_id"], product_id=row["product_id"]
+        )
+        items.filter(pk=row["first_id"]).update(quantity=row["quantity_sum"])
+        items.exclude(pk=row["first_id"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0017_image_variants"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="basketitem",
+            constraint=models.UniqueConstraint(
+                fields=("basket", "product"), name="shopapp_basketitem_unique_product"
+            ),
+        ),
+    ]
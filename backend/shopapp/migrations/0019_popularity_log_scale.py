@@ -0,0 +1,47 @@
+import datetime
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations
+
+POPULARITY_EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def recalculate_popularity(apps, schema_editor):
+    """popularity хранился суммой весов, теперь - log2 этой суммы"""
+    Product = apps.get_model("shopapp", "Product")
+    Order = apps.get_model("shopapp", "Order")
+    orders_count = defaultdict(int)
+    popularity = defaultdict(float)
+    ordered = Order.products.through.objects.filter(
+        order__status="paid"
+    ).values_list("product_id", "order__created_at")
+    for product_id, created_at in ordered.iterator():
+        days = (created_at - POPULARITY_EPOCH).total_seconds() / 86400
+        score = days / settings.POPULARITY_HALF_LIFE_DAYS
+        if orders_count[product_id]:
+            high, low = sorted((popularity[product_id], score), reverse=True)
+            score = high + math.log2(1 + 2 ** (low - high))
+        orders_count[product_id] += 1
+        popularity[product_id] = score
+    Product.objects.update(orders_count=0, popularity=0)
+    Product.objects.bulk_update(
+        [
+            Product(pk=pk, orders_count=count, popularity=popularity[pk])
+            for pk, count in orders_count.items()
+        ],
+        ["orders_count", "popularity"],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0018_basketitem_unique_product"),
+    ]
+
+    operations = [
+        migrations.RunPython(recalculate_popularity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.5 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+def mark_never_ordered(apps, schema_editor):
+    """popularity = 0 у продуктов без заказов выше отрицательных весов
+    заказов до точки отсчета, поэтому у них теперь -inf"""
+    Product = apps.get_model("shopapp", "Product")
+    Product.objects.filter(orders_count=0).update(popularity=float("-inf"))
+
+
+def unmark_never_ordered(apps, schema_editor):
+    Product = apps.get_model("shopapp", "Product")
+    Product.objects.filter(orders_count=0).update(popularity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0019_popularity_log_scale"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="product",
+            name="popularity",
+            field=models.FloatField(
+                default=float("-inf"), editable=False, verbose_name="Популярность"
+            ),
+        ),
+        migrations.RunPython(mark_never_ordered, unmark_never_ordered),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.5 on 2026-10-18 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0020_popularity_sentinel"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="order",
+            name="totalCost",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                max_digits=12,
+                verbose_name="Итоговая сумма заказа",
+            ),
+        ),
+    ]
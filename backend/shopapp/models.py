@@ -1,11 +1,45 @@
+import datetime
+import math
+from collections import defaultdict
 from decimal import Decimal
-from django.db import models
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from django.db.models import (
+    Case,
+    Count,
+    Exists,
+    F,
+    FloatField,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.expressions import Combinable
+from django.db.models.functions import Abs, Cast, Coalesce, Greatest, Log, Power
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 from myauth.models import ProfileUser
 from django.contrib.auth.models import User
 from mptt.models import MPTTModel, TreeForeignKey
 
+from backend.images import image_data
+
+from .cache import CATEGORY_TREE, HOMEPAGE, bump_version, make_key
+
+# точка отсчета весов заказов в Product.popularity (см. Product.popularity_score)
+POPULARITY_EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+# popularity продукта без оплаченных заказов: ниже любого log2 веса, в том числе
+# отрицательного у заказов до POPULARITY_EPOCH
+NO_POPULARITY = float("-inf")
+
 
 def category_image_directory_path(instance: "Category", filename: str) -> str:
     return f"categories/category_{instance.pk}/image/{filename}"
@@ -20,6 +54,12 @@ class Category(MPTTModel):
         default="categories/default.jpg",
         verbose_name="Изображение",
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Варианты изображения",
+    )
     parent = TreeForeignKey(
         "self",
         on_delete=models.CASCADE,
@@ -28,17 +68,19 @@ class Category(MPTTModel):
         related_name="children",
         verbose_name="Родительская категория",
     )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
 
     class Meta:
         verbose_name = "Категория"
         verbose_name_plural = "Категории"
+        indexes = [
+            models.Index(
+                fields=["tree_id", "lft", "rght"], name="shopapp_category_subtree"
+            ),
+        ]
 
     def get_image(self) -> dict[str: any]:
-        image = {
-            "src": self.image.url,
-            "alt": self.image.name,
-        }
-        return image
+        return image_data(self.image, self.image_variants)
 
     @staticmethod
     def get_categories() -> list["Category"]:
@@ -46,6 +88,43 @@ class Category(MPTTModel):
         categories = Category.objects.filter(parent__isnull=True)
         return categories
 
+    @staticmethod
+    def get_tree_bounds() -> dict[int, tuple[int, int, int]]:
+        """границы поддеревьев всех категорий: id -> (tree_id, lft, rght),
+        хранятся в кэше до изменения дерева, но не дольше
+        CATEGORY_TREE_CACHE_TIMEOUT"""
+        key = make_key(CATEGORY_TREE, "bounds")
+        bounds = cache.get(key)
+        if bounds is None:
+            bounds = {
+                pk: (tree_id, lft, rght)
+                for pk, tree_id, lft, rght in Category.objects.values_list(
+                    "pk", "tree_id", "lft", "rght"
+                )
+            }
+            cache.set(key, bounds, settings.CATEGORY_TREE_CACHE_TIMEOUT)
+        return bounds
+
+    @staticmethod
+    def get_subtree_bounds(category_id: int | str) -> tuple[int, int, int] | None:
+        """границы поддерева категории или None, если такой категории нет"""
+        try:
+            return Category.get_tree_bounds().get(int(category_id))
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def get_tree() -> list["Category"]:
+        """корневые категории с потомками в tree_descendants, одним запросом"""
+        roots = []
+        for category in Category.objects.order_by("tree_id", "lft"):
+            if category.parent_id is None:
+                category.tree_descendants = []
+                roots.append(category)
+            elif roots and roots[-1].tree_id == category.tree_id:
+                roots[-1].tree_descendants.append(category)
+        return roots
+
     def get_subcategories(self) -> list["Category"]:
         """Возвращает все подкатегории категории"""
         subcategories = self.get_descendants()
@@ -58,6 +137,7 @@ class Category(MPTTModel):
 class Tag(models.Model):
 
     name = models.CharField(max_length=200, verbose_name="Название тега")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
 
     def __str__(self) -> str:
         return f"{self.name}"
@@ -67,6 +147,106 @@ class Tag(models.Model):
         verbose_name_plural = "Теги"
 
 
+class ProductQuerySet(models.QuerySet):
+    # сортировки каталога: значение параметра sort -> колонка под индексом
+    SORT_FIELDS = {
+        "id": "id",
+        "price": "effective_price",
+        "rating": "rating",
+        "reviews": "rating_count",
+        "date": "date",
+        "title": "title",
+        "count": "count",
+    }
+    CARD_FIELDS = (
+        "id",
+        "category_id",
+        "price",
+        "count",
+        "date",
+        "title",
+        "free_delivery",
+        "rating",
+        "rating_count",
+        "effective_price",
+    )
+
+    @staticmethod
+    def serializer_prefetches(prefix: str = "") -> list[Prefetch]:
+        """план загрузки связей для ProductSerializer, prefix - путь до продукта"""
+        return [
+            Prefetch(f"{prefix}tags", queryset=Tag.objects.only("id", "name")),
+            Prefetch(
+                f"{prefix}images",
+                queryset=ProductImage.objects.only(
+                    "id", "product_id", "image", "image_variants"
+                ),
+            ),
+            Prefetch(
+                f"{prefix}specifications",
+                queryset=Specification.objects.only(
+                    "id", "product_id", "name", "value"
+                ),
+            ),
+            Prefetch(
+                f"{prefix}reviews",
+                queryset=Review.objects.select_related("author").only(
+                    "id",
+                    "product_id",
+                    "text",
+                    "rate",
+                    "date",
+                    "author",
+                    "author__name",
+                    "author__surname",
+                    "author__email",
+                ),
+            ),
+        ]
+
+    def for_serializer(self) -> "ProductQuerySet":
+        """подгружает все, что нужно ProductSerializer, постоянным числом запросов"""
+        return self.prefetch_related(*self.serializer_prefetches())
+
+    @staticmethod
+    def card_prefetches(prefix: str = "") -> list[Prefetch]:
+        """план загрузки связей для карточки: теги и первое изображение"""
+        return [
+            Prefetch(f"{prefix}tags", queryset=Tag.objects.only("id", "name")),
+            Prefetch(
+                f"{prefix}images",
+                queryset=ProductImage.objects.only(
+                    "id", "product_id", "image", "image_variants"
+                ).order_by("id")[:1],
+                to_attr="card_images",
+            ),
+        ]
+
+    def in_category(
+        self, bounds: tuple[int, int, int] | None
+    ) -> "ProductQuerySet":
+        """продукты категории и всех ее подкатегорий по границам mptt"""
+        if bounds is None:
+            return self.none()
+        tree_id, lft, rght = bounds
+        return self.filter(
+            category__tree_id=tree_id,
+            category__lft__gte=lft,
+            category__rght__lte=rght,
+        )
+
+    def for_list(self) -> "ProductQuerySet":
+        """только колонки и связи, которые нужны ProductShortSerializer"""
+        return (
+            self.only(*self.CARD_FIELDS)
+            .prefetch_related(*self.card_prefetches())
+        )
+
+
+# отправляется после списания остатков UPDATE-ом, который не вызывает post_save
+stock_changed = Signal()
+
+
 class Product(models.Model):
 
     category = TreeForeignKey(
@@ -75,6 +255,13 @@ class Product(models.Model):
     price = models.DecimalField(
         default=0, max_digits=8, decimal_places=2, verbose_name="Цена"
     )
+    effective_price = models.DecimalField(
+        default=0,
+        max_digits=8,
+        decimal_places=2,
+        editable=False,
+        verbose_name="Цена с учетом скидки",
+    )
     count = models.IntegerField(default=0, verbose_name="Количество")
     date = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     title = models.CharField(max_length=200, verbose_name="Название продукта")
@@ -91,30 +278,276 @@ class Product(models.Model):
         validators=[MinValueValidator(0), MaxValueValidator(5)],
         verbose_name="Рейтинг",
     )
+    rating_sum = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Сумма оценок"
+    )
+    rating_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Количество оценок"
+    )
+    search_vector = SearchVectorField(
+        null=True, editable=False, verbose_name="Поисковый документ"
+    )
+    orders_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Количество оплаченных заказов"
+    )
+    popularity = models.FloatField(
+        default=NO_POPULARITY, editable=False, verbose_name="Популярность"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
-        ordering = ["title", "price"]
         verbose_name = "Продукт"
         verbose_name_plural = "Продукты"
+        # сортировки каталога идут по (поле, id) в обе стороны, поэтому
+        # у каждого поля из ProductQuerySet.SORT_FIELDS свой индекс с id
+        indexes = [
+            models.Index(
+                fields=["effective_price", "id"], name="shopapp_product_price"
+            ),
+            models.Index(fields=["rating", "id"], name="shopapp_product_rating"),
+            models.Index(
+                fields=["rating_count", "id"], name="shopapp_product_reviews"
+            ),
+            models.Index(fields=["date", "id"], name="shopapp_product_date"),
+            models.Index(fields=["title", "id"], name="shopapp_product_title"),
+            models.Index(fields=["count", "id"], name="shopapp_product_count"),
+            models.Index(
+                fields=["popularity", "id"], name="shopapp_product_popularity"
+            ),
+            models.Index(fields=["updated_at"], name="shopapp_product_updated_at"),
+            models.Index(
+                fields=["category", "effective_price", "id"],
+                name="shopapp_product_category_price",
+            ),
+            models.Index(
+                fields=["effective_price", "id"],
+                condition=Q(count__gt=0),
+                name="shopapp_product_instock_price",
+            ),
+            models.Index(
+                fields=["rating", "id"],
+                condition=Q(count__gt=0),
+                name="shopapp_product_instock_rating",
+            ),
+        ]
 
     def get_image(self) -> list[dict[str: any]]:
         images = ProductImage.objects.filter(product_id=self.pk)
-        return [{"src": image.image.url, "alt": image.image.name} for image in images]
+        return [image_data(image.image, image.image_variants) for image in images]
+
+    def get_rating(self) -> float:
+        """возвращает средний рейтинг по сохраненным сумме и количеству оценок"""
+        if self.rating_count == 0:
+            return 0
+        return self.rating_sum / self.rating_count
+
+    @staticmethod
+    def rating_expression(
+        rating_sum: Combinable, rating_count: Combinable, is_empty: Q | Exists
+    ) -> Case:
+        """выражение среднего рейтинга для UPDATE, 0 если оценок нет"""
+        return Case(
+            When(is_empty, then=Value(Decimal(0))),
+            default=Cast(
+                Cast(rating_sum, FloatField()) / rating_count,
+                models.DecimalField(max_digits=3, decimal_places=2),
+            ),
+        )
+
+    @staticmethod
+    def apply_rating_delta(product_id: int, rate_delta: int, count_delta: int) -> None:
+        """атомарно изменяет сумму и количество оценок продукта одним UPDATE"""
+        rating_sum = F("rating_sum") + rate_delta
+        rating_count = F("rating_count") + count_delta
+        Product.objects.filter(pk=product_id).update(
+            rating_sum=rating_sum,
+            rating_count=rating_count,
+            rating=Product.rating_expression(
+                rating_sum, rating_count, Q(rating_count__lte=-count_delta)
+            ),
+            updated_at=timezone.now(),
+        )
+
+    @staticmethod
+    def recalculate_ratings() -> list[int]:
+        """пересчитывает агрегаты рейтинга по таблице отзывов,
+        возвращает id продуктов, у которых они разошлись с отзывами"""
+        reviews = (
+            Review.objects.filter(product=OuterRef("pk")).order_by().values("product")
+        )
+        rating_sum = Coalesce(
+            Subquery(reviews.annotate(total=Sum("rate")).values("total")), 0
+        )
+        rating_count = Coalesce(
+            Subquery(reviews.annotate(total=Count("id")).values("total")), 0
+        )
+        changed = list(
+            Product.objects.annotate(new_sum=rating_sum, new_count=rating_count)
+            .exclude(rating_sum=F("new_sum"), rating_count=F("new_count"))
+            .values_list("pk", flat=True)
+        )
+        if changed:
+            Product.objects.filter(pk__in=changed).update(
+                rating_sum=rating_sum,
+                rating_count=rating_count,
+                rating=Product.rating_expression(
+                    rating_sum, rating_count, ~Exists(reviews)
+                ),
+                updated_at=timezone.now(),
+            )
+        return changed
+
+    @staticmethod
+    def effective_price_expression() -> Combinable:
+        """цена с учетом скидки, действующей сегодня"""
+        discount = (
+            Sale.objects.active().filter(product=OuterRef("pk")).values("discount")
+        )
+        return Greatest(
+            F("price") - Coalesce(Subquery(discount), Value(Decimal(0))),
+            Value(Decimal(0)),
+            output_field=models.DecimalField(max_digits=8, decimal_places=2),
+        )
+
+    def get_effective_price(self) -> Decimal:
+        """цена с учетом скидки для сохраняемого продукта"""
+        discount = None
+        if self.pk is not None:
+            discount = (
+                Sale.objects.active()
+                .filter(product_id=self.pk)
+                .values_list("discount", flat=True)
+                .first()
+            )
+        return max(Decimal(self.price) - (discount or 0), Decimal(0))
+
+    @staticmethod
+    def sync_effective_prices(product_ids: list[int] | None = None) -> list[int]:
+        """приводит effective_price в соответствие с действующими скидками,
+        возвращает id продуктов, у которых цена изменилась"""
+        products = Product.objects.all()
+        if product_ids is not None:
+            products = products.filter(pk__in=product_ids)
+        changed = list(
+            products.annotate(new_price=Product.effective_price_expression())
+            .exclude(effective_price=F("new_price"))
+            .values_list("pk", flat=True)
+        )
+        if changed:
+            Product.objects.filter(pk__in=changed).update(
+                effective_price=Product.effective_price_expression(),
+                updated_at=timezone.now(),
+            )
+        return changed
+
+    @staticmethod
+    def take_from_stock(quantities: dict[int, int]) -> bool:
+        """списывает со склада {id продукта: количество} без гонки с другими
+        покупками, если какого-то продукта не хватает, не списывает ничего"""
+        with transaction.atomic():
+            for product_id, quantity in quantities.items():
+                updated = Product.objects.filter(
+                    pk=product_id, count__gte=quantity
+                ).update(count=F("count") - quantity, updated_at=timezone.now())
+                if not updated:
+                    transaction.set_rollback(True)
+                    return False
+        if quantities:
+            stock_changed.send(sender=Product, product_ids=list(quantities))
+        return True
+
+    @staticmethod
+    def touch(product_ids: list[int]) -> None:
+        """отмечает продукты измененными, когда меняются связанные с ними данные"""
+        Product.objects.filter(pk__in=product_ids).update(updated_at=timezone.now())
+
+    @staticmethod
+    def popularity_score(moment: datetime.datetime) -> float:
+        """Двоичный логарифм веса заказа в popularity.
 
-    def get_rating(self) -> int:
-        reviews = Review.objects.filter(product_id=self.pk).values_list(
-            "rate", flat=True
+        Вес удваивается каждые POPULARITY_HALF_LIFE_DAYS: старые заказы затухают
+        относительно новых без пересчета накопленных сумм. Сами веса растут без
+        предела, поэтому popularity хранит log2 их суммы, который растет линейно
+        и не переполняется.
+        """
+        days = (moment - POPULARITY_EPOCH).total_seconds() / 86400
+        return days / settings.POPULARITY_HALF_LIFE_DAYS
+
+    @staticmethod
+    def add_popularity(score: float, other: float) -> float:
+        """log2(2 ** score + 2 ** other) без вычисления самих степеней"""
+        high, low = max(score, other), min(score, other)
+        return high + math.log2(1 + 2 ** (low - high))
+
+    @staticmethod
+    def register_order(product_ids: list[int], moment=None) -> None:
+        """учитывает оплаченный заказ в счетчике и популярности одним UPDATE"""
+        score = Value(Product.popularity_score(moment or timezone.now()))
+        popularity = F("popularity")
+        Product.objects.filter(pk__in=product_ids).update(
+            orders_count=F("orders_count") + 1,
+            # то же, что add_popularity, но в базе; у продукта без заказов
+            # popularity = NO_POPULARITY не вес, а его отсутствие
+            popularity=Case(
+                When(orders_count=0, then=score),
+                default=Greatest(popularity, score)
+                + Log(2, 1 + Power(2, -Abs(popularity - score))),
+            ),
         )
-        if reviews.count() == 0:
-            rating = 0
-            return rating
-        rating = sum(reviews) / reviews.count()
-        return rating
+        # UPDATE не вызывает сигналов, список популярных сбрасывается здесь
+        transaction.on_commit(lambda: bump_version(HOMEPAGE))
+
+    @staticmethod
+    def recalculate_popularity() -> int:
+        """пересчитывает счетчик заказов и популярность по оплаченным заказам"""
+        orders_count = defaultdict(int)
+        popularity = defaultdict(float)
+        ordered = Order.products.through.objects.filter(
+            order__status="paid"
+        ).values_list("product_id", "order__created_at")
+        for product_id, created_at in ordered.iterator():
+            score = Product.popularity_score(created_at)
+            if orders_count[product_id]:
+                score = Product.add_popularity(popularity[product_id], score)
+            orders_count[product_id] += 1
+            popularity[product_id] = score
+        products = [
+            Product(pk=pk, orders_count=count, popularity=popularity[pk])
+            for pk, count in orders_count.items()
+        ]
+        with transaction.atomic():
+            Product.objects.update(orders_count=0, popularity=NO_POPULARITY)
+            Product.objects.bulk_update(
+                products, ["orders_count", "popularity"], batch_size=500
+            )
+        transaction.on_commit(lambda: bump_version(HOMEPAGE))
+        return len(products)
 
     def __str__(self) -> str:
         return f"{self.title}"
 
 
+class ProductDocument(models.Model):
+    """готовый JSON карточки и детальной страницы продукта, обновляется при записи"""
+
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="document",
+        verbose_name="Продукт",
+    )
+    card = models.TextField(verbose_name="JSON карточки")
+    detail = models.TextField(verbose_name="JSON детальной страницы")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
+
+    class Meta:
+        verbose_name = "Документ продукта"
+        verbose_name_plural = "Документы продуктов"
+
+
 def product_images_directory_path(instance: Product, filename: str) -> str:
     return f"products/product_{instance.pk}/image/{filename}"
 
@@ -126,6 +559,12 @@ class ProductImage(models.Model):
     image = models.ImageField(
         upload_to=product_images_directory_path, default="products/default.jpg"
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Варианты изображения",
+    )
 
     class Meta:
         verbose_name = "Изображение"
@@ -180,6 +619,29 @@ class Specification(models.Model):
         return f"{self.name}: {self.value}"
 
 
+class SaleQuerySet(models.QuerySet):
+    def active(self, day: datetime.date | None = None) -> "SaleQuerySet":
+        """скидки, действующие в указанный день, по умолчанию сегодня"""
+        day = day or timezone.localdate()
+        return self.filter(date_from__lte=day, date_to__gte=day)
+
+    def for_list(self) -> "SaleQuerySet":
+        """только колонки и связи, которые нужны SaleSerializer"""
+        return (
+            self.select_related("product")
+            .only(
+                "id",
+                "product_id",
+                "date_from",
+                "date_to",
+                "discount",
+                "product__price",
+                "product__title",
+            )
+            .prefetch_related("product__images")
+        )
+
+
 class Sale(models.Model):
     product = models.OneToOneField(
         Product,
@@ -192,10 +654,22 @@ class Sale(models.Model):
     discount = models.DecimalField(
         max_digits=10, decimal_places=2, verbose_name="Скидка"
     )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
+
+    objects = SaleQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Скидка"
         verbose_name_plural = "Скидки"
+        indexes = [
+            models.Index(
+                fields=["date_to", "date_from"], name="shopapp_sale_active_range"
+            ),
+        ]
+
+    def is_active(self) -> bool:
+        """действует ли скидка сегодня"""
+        return self.date_from <= timezone.localdate() <= self.date_to
 
 
 class Basket(models.Model):
@@ -205,10 +679,151 @@ class Basket(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def get_total_cost(self) -> Decimal:
-        return sum([item.product.price * item.quantity for item in self.items.all()])
+        return self.get_totals()["totalCost"]
+
+    def get_products(self) -> "ProductQuerySet":
+        return Product.objects.filter(products__basket=self)
+
+    @staticmethod
+    def totals_expressions(prefix: str = "") -> dict[str:any]:
+        """агрегаты итогов корзины по ценам со скидкой (Product.effective_price)"""
+        return {
+            "count": Coalesce(Sum(f"{prefix}quantity"), 0),
+            "positions": Count(f"{prefix}id"),
+            "totalCost": Coalesce(
+                Sum(F(f"{prefix}quantity") * F(f"{prefix}product__effective_price")),
+                Value(Decimal(0)),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+        }
 
-    def get_products(self) -> list[Product]:
-        return [item.product for item in self.items.all()]
+    def get_totals(self) -> dict[str: any]:
+        """число товаров, позиций и сумма корзины по ценам со скидкой, один запрос"""
+        return self.items.aggregate(**self.totals_expressions())
+
+    @staticmethod
+    def empty_summary(delivery_type: str = "delivery") -> dict[str: any]:
+        """итоги корзины пользователя, у которого корзины еще нет"""
+        totals = {"count": 0, "positions": 0, "totalCost": Decimal(0)}
+        return DeliveryPrice.summarize(
+            totals, DeliveryPrice.get_rules(), delivery_type
+        )
+
+    def get_summary(self, delivery_type: str = "delivery") -> dict[str: any]:
+        """итоги корзины вместе со стоимостью доставки одним запросом:
+        суммы по позициям и правила DeliveryPrice подзапросами"""
+        rules = DeliveryPrice.objects.order_by("pk")
+        row = (
+            Basket.objects.filter(pk=self.pk)
+            .values("pk")
+            .annotate(
+                **self.totals_expressions("items__"),
+                **{
+                    field: Subquery(rules.values(field)[:1])
+                    for field in DeliveryPrice.RULE_FIELDS
+                },
+            )
+            .get()
+        )
+        totals = {key: row[key] for key in ("count", "positions", "totalCost")}
+        rules = {field: row[field] for field in DeliveryPrice.RULE_FIELDS}
+        return DeliveryPrice.summarize(totals, rules, delivery_type)
+
+    def apply_changes(self, changes: list[dict[str:any]]) -> dict[int, str]:
+        """Применяет изменения позиций корзины одной транзакцией.
+
+        Каждое изменение - {"id", "count", "action"}: add добавляет count штук,
+        set устанавливает количество (0 удаляет позицию), remove убирает count
+        штук. Остатки продуктов и позиции читаются двумя запросами, запись -
+        bulk_create, bulk_update и один DELETE. Возвращает ошибки по id
+        продуктов, при ошибках корзина не меняется.
+        """
+        product_ids = {change["id"] for change in changes}
+        with transaction.atomic():
+            stock = dict(
+                Product.objects.filter(pk__in=product_ids).values_list("pk", "count")
+            )
+            items = {
+                item.product_id: item
+                for item in self.items.select_for_update().filter(
+                    product_id__in=product_ids
+                )
+            }
+            quantities = {pk: item.quantity for pk, item in items.items()}
+            errors = {}
+            for change in changes:
+                product_id, count = change["id"], change["count"]
+                if product_id not in stock:
+                    errors[product_id] = "Продукт не найден"
+                    continue
+                current = quantities.get(product_id, 0)
+                if change["action"] == "add":
+                    quantity = current + count
+                elif change["action"] == "set":
+                    quantity = count
+                else:
+                    quantity = max(current - count, 0)
+                # остаток мог упасть ниже позиции, уменьшать ее можно всегда
+                if quantity > current and quantity > stock[product_id]:
+                    errors[product_id] = "Недостаточно товара на складе"
+                    continue
+                quantities[product_id] = quantity
+            if errors:
+                return errors
+
+            created = [
+                BasketItem(basket=self, product_id=product_id, quantity=quantity)
+                for product_id, quantity in quantities.items()
+                if quantity and product_id not in items
+            ]
+            updated = []
+            for product_id, item in items.items():
+                if quantities[product_id] and quantities[product_id] != item.quantity:
+                    item.quantity = quantities[product_id]
+                    updated.append(item)
+            deleted = [
+                product_id for product_id in items if not quantities[product_id]
+            ]
+            # позицию могли создать параллельно, тогда пишется наше количество
+            BasketItem.objects.bulk_create(
+                created,
+                update_conflicts=True,
+                unique_fields=["basket", "product"],
+                update_fields=["quantity"],
+            )
+            BasketItem.objects.bulk_update(updated, ["quantity"])
+            if deleted:
+                self.items.filter(product_id__in=deleted).delete()
+        return errors
+
+    def merge_items(self, quantities: dict[int, int]) -> None:
+        """добавляет позиции (гостевой корзины) одним INSERT ... ON CONFLICT,
+        количество каждой позиции ограничивается остатком на складе"""
+        with transaction.atomic():
+            stock = dict(
+                Product.objects.filter(pk__in=quantities).values_list("pk", "count")
+            )
+            current = dict(
+                self.items.select_for_update()
+                .filter(product_id__in=stock)
+                .values_list("product_id", "quantity")
+            )
+            merged = []
+            for product_id, count in stock.items():
+                quantity = current.get(product_id, 0) + quantities[product_id]
+                quantity = min(quantity, count)
+                if quantity > 0:
+                    merged.append(
+                        BasketItem(
+                            basket=self, product_id=product_id, quantity=quantity
+                        )
+                    )
+            BasketItem.objects.bulk_create(
+                merged,
+                update_conflicts=True,
+                unique_fields=["basket", "product"],
+                update_fields=["quantity"],
+            )
 
 
 class BasketItem(models.Model):
@@ -219,6 +834,49 @@ class BasketItem(models.Model):
     )
     quantity = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["basket", "product"], name="shopapp_basketitem_unique_product"
+            ),
+        ]
+
+    @staticmethod
+    def add(basket_id: int, product_id: int, count: int) -> int | None:
+        """Добавляет count штук продукта в корзину одним INSERT ... ON CONFLICT.
+
+        Новая позиция создается, существующая увеличивается на месте, и только
+        если на складе хватает товара на все количество в корзине. Возвращает
+        новое количество позиции или None, если товара не хватает или его нет.
+        """
+        quote = connection.ops.quote_name
+        item, product = BasketItem._meta.db_table, Product._meta.db_table
+        sql = (
+            f"INSERT INTO {quote(item)} (basket_id, product_id, quantity) "
+            f"SELECT %s, id, %s FROM {quote(product)} "
+            f"WHERE id = %s AND {quote('count')} >= %s "
+            f"ON CONFLICT (basket_id, product_id) DO UPDATE "
+            f"SET quantity = {quote(item)}.quantity + excluded.quantity "
+            f"WHERE {quote(item)}.quantity + excluded.quantity <= ("
+            f"SELECT {quote('count')} FROM {quote(product)} "
+            f"WHERE id = excluded.product_id) "
+            f"RETURNING quantity"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [basket_id, count, product_id, count])
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def remove(basket_id: int, product_id: int, count: int) -> bool:
+        """уменьшает позицию на count штук или удаляет ее, если столько не осталось;
+        каждый запрос сам проверяет текущее количество, без чтения позиции"""
+        items = BasketItem.objects.filter(basket_id=basket_id, product_id=product_id)
+        if items.filter(quantity__gt=count).update(quantity=F("quantity") - count):
+            return True
+        deleted, _ = items.filter(quantity__lte=count).delete()
+        return bool(deleted)
+
 
 class Order(models.Model):
 
@@ -254,7 +912,7 @@ class Order(models.Model):
     )
     totalCost = models.DecimalField(
         default=0,
-        max_digits=8,
+        max_digits=12,
         decimal_places=2,
         verbose_name="Итоговая сумма заказа",
     )
@@ -295,9 +953,43 @@ class DeliveryPrice(models.Model):
         verbose_name="Наименьшая сумма для бесплатной доставки",
     )
 
+    RULE_FIELDS = (
+        "delivery_cost",
+        "delivery_express_cost",
+        "delivery_free_minimum_cost",
+    )
+
     class Meta:
         verbose_name = "Стоимость доставки"
 
+    @staticmethod
+    def get_rules() -> dict[str: any]:
+        rules = DeliveryPrice.objects.order_by("pk").values(*DeliveryPrice.RULE_FIELDS)
+        return rules.first() or {}
+
+    @staticmethod
+    def summarize(
+        totals: dict[str: any], rules: dict[str: any], delivery_type: str
+    ) -> dict[str: any]:
+        """Добавляет к итогам корзины доставку по правилам DeliveryPrice.
+
+        Обычная доставка бесплатна, если сумма больше delivery_free_minimum_cost,
+        экспресс-доставка доплачивается всегда. Без правил доставка бесплатна.
+        """
+        free_from = rules.get("delivery_free_minimum_cost")
+        delivery_cost = Decimal(0)
+        if free_from is not None and totals["totalCost"] <= free_from:
+            delivery_cost += rules["delivery_cost"]
+        if delivery_type == "express":
+            delivery_cost += rules.get("delivery_express_cost") or 0
+        return {
+            **totals,
+            "deliveryType": delivery_type,
+            "deliveryCost": delivery_cost,
+            "freeDeliveryFrom": free_from,
+            "total": totals["totalCost"] + delivery_cost,
+        }
+
 
 class Payment(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="pay_order")
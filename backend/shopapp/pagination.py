@@ -0,0 +1,190 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import (
+    FieldDoesNotExist,
+    ValidationError as DjangoValidationError,
+)
+from django.db.models import Model, Q
+from django.db.models.query import QuerySet
+from django.http import HttpRequest
+from rest_framework.exceptions import ValidationError
+
+
+def is_cursor_mode(request: HttpRequest) -> bool:
+    """включен ли постраничный вывод по курсору"""
+    return "cursor" in request.GET or request.GET.get("pagination") == "cursor"
+
+
+def int_param(
+    request: HttpRequest, name: str, default: int, min_value: int | None = None
+) -> int:
+    """целый параметр запроса, ValidationError (400) вместо ошибки сервера"""
+    value = request.GET.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValidationError({name: "Ожидается целое число"})
+    if min_value is not None and number < min_value:
+        raise ValidationError({name: f"Значение должно быть не меньше {min_value}"})
+    return number
+
+
+def clamp_page_number(page_number: int, num_pages: int) -> tuple[int, int]:
+    """ограничивает глубину постраничного вывода через OFFSET,
+    возвращает номер страницы и номер последней доступной страницы"""
+    last_page = min(num_pages, settings.CATALOG_MAX_PAGE_NUMBER)
+    return max(1, min(page_number, last_page)), last_page
+
+
+class KeysetPaginator:
+    """Постраничный вывод по ключу (значение поля сортировки, id).
+
+    Вместо COUNT(*) и OFFSET следующая страница выбирается условием на ключ
+    последней записи, поэтому стоимость запроса не зависит от глубины страницы.
+    Курсор - непрозрачная строка, которую клиент получает в ссылках next/prev.
+    """
+
+    def __init__(
+        self,
+        queryset: QuerySet,
+        sort_field: str = "id",
+        descending: bool = False,
+        limit: int = 20,
+    ) -> None:
+        # аннотация запроса, например релевантность поиска
+        annotation = queryset.query.annotations.get(sort_field)
+        self.annotated = annotation is not None
+        if self.annotated:
+            self.field = annotation.output_field
+            self.sort_field = sort_field
+        else:
+            try:
+                self.field = queryset.model._meta.get_field(sort_field)
+            except FieldDoesNotExist:
+                raise ValidationError(
+                    {"sort": f"Сортировка по '{sort_field}' не поддерживается"}
+                )
+            if not self.field.concrete or self.field.many_to_many:
+                raise ValidationError(
+                    {"sort": f"Сортировка по '{sort_field}' не поддерживается"}
+                )
+            self.sort_field = self.field.attname
+        self.queryset = queryset
+        self.descending = descending
+        self.limit = limit
+
+    def encode_cursor(self, obj: Model, backwards: bool) -> str:
+        if self.annotated:
+            value = getattr(obj, self.sort_field)
+        else:
+            value = self.field.value_to_string(obj)
+        payload = {
+            "v": value,
+            "id": obj.pk,
+            "b": backwards,
+        }
+        raw = json.dumps(payload, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode_cursor(self, cursor: str) -> tuple[object, int, bool]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            payload = json.loads(raw)
+            return (
+                self.field.to_python(payload["v"]),
+                int(payload["id"]),
+                bool(payload["b"]),
+            )
+        except (
+            binascii.Error,
+            ValueError,
+            KeyError,
+            TypeError,
+            DjangoValidationError,
+        ):
+            raise ValidationError({"cursor": "Некорректный курсор"})
+
+    def ordered(self, backwards: bool) -> QuerySet:
+        descending = self.descending != backwards
+        prefix = "-" if descending else ""
+        return self.queryset.order_by(f"{prefix}{self.sort_field}", f"{prefix}pk")
+
+    def after(
+        self, queryset: QuerySet, value: object, pk: int, backwards: bool
+    ) -> QuerySet:
+        lookup = "lt" if self.descending != backwards else "gt"
+        return queryset.filter(
+            Q(**{f"{self.sort_field}__{lookup}": value})
+            | Q(**{self.sort_field: value, f"pk__{lookup}": pk})
+        )
+
+    def get_page(
+        self, cursor: str | None
+    ) -> tuple[list[Model], str | None, str | None]:
+        """возвращает записи страницы и курсоры следующей и предыдущей страниц"""
+        backwards = False
+        queryset = self.ordered(backwards)
+        if cursor:
+            value, pk, backwards = self.decode_cursor(cursor)
+            queryset = self.after(self.ordered(backwards), value, pk, backwards)
+
+        items = list(queryset[: self.limit + 1])
+        has_more = len(items) > self.limit
+        items = items[: self.limit]
+        if backwards:
+            items.reverse()
+        if not items:
+            return items, None, None
+
+        has_next = has_more or backwards
+        has_prev = has_more if backwards else bool(cursor)
+        next_cursor = self.encode_cursor(items[-1], False) if has_next else None
+        prev_cursor = self.encode_cursor(items[0], True) if has_prev else None
+        return items, next_cursor, prev_cursor
+
+
+def cursor_link(request: HttpRequest, cursor: str | None) -> str | None:
+    """ссылка на ту же выборку с другим курсором"""
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params.pop("currentPage", None)
+    params["cursor"] = cursor
+    return request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+
+def cursor_page(
+    request: HttpRequest,
+    queryset: QuerySet,
+    sort_field: str = "id",
+    descending: bool = False,
+    limit: int = 20,
+) -> tuple[list[Model], str | None, str | None]:
+    """записи страницы по курсору и ссылки на следующую и предыдущую страницы"""
+    paginator = KeysetPaginator(queryset, sort_field, descending, limit)
+    items, next_cursor, prev_cursor = paginator.get_page(request.GET.get("cursor"))
+    return items, cursor_link(request, next_cursor), cursor_link(request, prev_cursor)
+
+
+def cursor_page_data(
+    request: HttpRequest,
+    queryset: QuerySet,
+    serializer_class: type,
+    sort_field: str = "id",
+    descending: bool = False,
+    limit: int = 20,
+) -> dict[str:any]:
+    """данные ответа для постраничного вывода по курсору"""
+    items, next_link, prev_link = cursor_page(
+        request, queryset, sort_field, descending, limit
+    )
+    return {
+        "items": serializer_class(items, many=True).data,
+        "next": next_link,
+        "prev": prev_link,
+    }
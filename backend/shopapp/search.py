@@ -0,0 +1,220 @@
+import re
+import threading
+from collections import defaultdict
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import (
+    Case,
+    F,
+    FloatField,
+    OuterRef,
+    Subquery,
+    TextField,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Concat
+from django.db.models.query import QuerySet
+
+from .models import Product, Specification
+
+# веса частей поискового документа, как у setweight() в Postgres: A > B > C > D
+WEIGHTS = {"A": 1.0, "B": 0.4, "C": 0.2, "D": 0.1}
+
+RUSSIAN_ENDINGS = sorted(
+    (
+        "иями ями ами ией ием иях ого его ому ему ыми ими ая яя ое ее ые ие ый ий ой "
+        "ей ом ем ам ям ах ях ую юю ию ья ье ьи ов ев ия ь а я о е ы и у ю й"
+    ).split(),
+    key=len,
+    reverse=True,
+)
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def stem(word: str) -> str:
+    """упрощенный стеммер: отрезает самое длинное окончание, основа от 3 букв"""
+    word = word.lower().replace("ё", "е")
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[: -len(ending)]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    return [stem(token) for token in TOKEN_RE.findall(text or "")]
+
+
+class PostgresSearchBackend:
+    """Поиск по колонке Product.search_vector (tsvector под GIN-индексом).
+
+    Документ собирается в самой базе: название с весом A, теги - B,
+    характеристики - C, описание - D, со стеммингом словаря russian.
+    """
+
+    config = "russian"
+
+    def document(self) -> SearchVector:
+        tags = (
+            Product.tags.through.objects.filter(product_id=OuterRef("pk"))
+            .values("product_id")
+            .annotate(text=StringAgg("tag__name", " "))
+            .values("text")
+        )
+        specifications = (
+            Specification.objects.filter(product_id=OuterRef("pk"))
+            .values("product_id")
+            .annotate(
+                text=StringAgg(
+                    Concat(
+                        Coalesce("name", Value("")),
+                        Value(" "),
+                        Coalesce("value", Value("")),
+                    ),
+                    " ",
+                )
+            )
+            .values("text")
+        )
+        return (
+            SearchVector("title", weight="A", config=self.config)
+            + SearchVector(
+                Coalesce(Subquery(tags), Value(""), output_field=TextField()),
+                weight="B",
+                config=self.config,
+            )
+            + SearchVector(
+                Coalesce(Subquery(specifications), Value(""), output_field=TextField()),
+                weight="C",
+                config=self.config,
+            )
+            + SearchVector("description", weight="D", config=self.config)
+        )
+
+    def update(self, product_ids: list[int]) -> None:
+        Product.objects.filter(pk__in=product_ids).update(search_vector=self.document())
+
+    def remove(self, product_ids: list[int]) -> None:
+        pass
+
+    def rebuild(self) -> None:
+        Product.objects.update(search_vector=self.document())
+
+    def search(self, products: QuerySet[Product], text: str) -> QuerySet[Product]:
+        query = SearchQuery(text, config=self.config, search_type="websearch")
+        return products.filter(search_vector=query).annotate(
+            relevance=SearchRank(F("search_vector"), query)
+        )
+
+
+class InMemorySearchBackend:
+    """Инвертированный индекс в памяти процесса для баз без полнотекстового поиска.
+
+    Используется в тестах на SQLite, при первом обращении строится по всей
+    таблице продуктов и дальше обновляется по сигналам сохранения.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.postings: dict[str, dict[int, float]] = defaultdict(dict)
+        self.documents: dict[int, set[str]] = {}
+
+    def documents_for(
+        self, product_ids: list[int] | None
+    ) -> dict[int, list[tuple[str, str]]]:
+        products = Product.objects.prefetch_related("tags", "specifications")
+        if product_ids is not None:
+            products = products.filter(pk__in=product_ids)
+        documents = {}
+        for product in products:
+            specifications = " ".join(
+                f"{spec.name or ''} {spec.value or ''}"
+                for spec in product.specifications.all()
+            )
+            documents[product.pk] = [
+                (product.title, "A"),
+                (" ".join(tag.name for tag in product.tags.all()), "B"),
+                (specifications, "C"),
+                (product.description, "D"),
+            ]
+        return documents
+
+    def index(self, product_id: int, parts: list[tuple[str, str]]) -> None:
+        self.unindex(product_id)
+        weights: dict[str, float] = defaultdict(float)
+        for text, weight in parts:
+            for token in tokenize(text):
+                weights[token] += WEIGHTS[weight]
+        for token, weight in weights.items():
+            self.postings[token][product_id] = weight
+        self.documents[product_id] = set(weights)
+
+    def unindex(self, product_id: int) -> None:
+        for token in self.documents.pop(product_id, ()):
+            self.postings[token].pop(product_id, None)
+
+    def rebuild(self) -> None:
+        documents = self.documents_for(None)
+        with self.lock:
+            self.postings.clear()
+            self.documents.clear()
+            for product_id, parts in documents.items():
+                self.index(product_id, parts)
+            self.loaded = True
+
+    def update(self, product_ids: list[int]) -> None:
+        if not self.loaded:
+            return
+        documents = self.documents_for(product_ids)
+        with self.lock:
+            for product_id in product_ids:
+                if product_id in documents:
+                    self.index(product_id, documents[product_id])
+                else:
+                    self.unindex(product_id)
+
+    def remove(self, product_ids: list[int]) -> None:
+        with self.lock:
+            for product_id in product_ids:
+                self.unindex(product_id)
+
+    def rank(self, text: str) -> dict[int, float]:
+        if not self.loaded:
+            self.rebuild()
+        tokens = set(tokenize(text))
+        if not tokens:
+            return {}
+        with self.lock:
+            postings = [self.postings.get(token, {}) for token in tokens]
+            matched = set.intersection(*(set(posting) for posting in postings))
+            return {
+                product_id: sum(posting[product_id] for posting in postings)
+                for product_id in matched
+            }
+
+    def search(self, products: QuerySet[Product], text: str) -> QuerySet[Product]:
+        scores = self.rank(text)
+        return products.filter(pk__in=scores).annotate(
+            relevance=Case(
+                *[When(pk=pk, then=Value(score)) for pk, score in scores.items()],
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+        )
+
+
+_backends: dict[str, PostgresSearchBackend | InMemorySearchBackend] = {}
+
+
+def get_search_backend() -> PostgresSearchBackend | InMemorySearchBackend:
+    """поисковый бэкенд для текущей базы данных"""
+    vendor = connection.vendor
+    if vendor not in _backends:
+        if vendor == "postgresql":
+            _backends[vendor] = PostgresSearchBackend()
+        else:
+            _backends[vendor] = InMemorySearchBackend()
+    return _backends[vendor]
@@ -1,6 +1,8 @@
 from decimal import Decimal
 from rest_framework import serializers
 
+from backend.images import image_data
+
 from .models import (
     Product,
     Tag,
@@ -24,17 +26,19 @@ class CategorySerializer(serializers.ModelSerializer):
     subcategories = serializers.SerializerMethodField()
 
     def get_image(self, obj: Category) -> dict[str: any]:
-        return {"src": obj.image.url, "alt": str(obj.image)}
+        return obj.get_image()
 
     def get_subcategories(self, obj: Category) -> list[dict[str: any]]:
-        children = obj.get_subcategories()
+        children = getattr(obj, "tree_descendants", None)
+        if children is None:
+            children = obj.get_subcategories()
         subcategories = []
         for child in children:
             subcategories.append(
                 {
                     "id": child.id,
                     "title": child.title,
-                    "image": {"src": child.image.url, "alt": str(child.image)},
+                    "image": child.get_image(),
                 }
             )
         return subcategories
@@ -47,10 +51,14 @@ class CategorySerializer(serializers.ModelSerializer):
 class ImageSerializer(serializers.ModelSerializer):
     src = serializers.CharField(source="image.url")
     alt = serializers.CharField(source="image.name")
+    variants = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductImage
-        fields = ("src", "alt")
+        fields = ("src", "alt", "variants")
+
+    def get_variants(self, obj: ProductImage) -> list[dict[str: any]]:
+        return image_data(obj.image, obj.image_variants)["variants"]
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -79,7 +87,7 @@ class ProductSerializer(serializers.ModelSerializer):
     images = ImageSerializer(many=True)
     reviews = ReviewSerializer(many=True)
     category = serializers.IntegerField(source="category_id")
-    rating = serializers.FloatField(source="get_rating")
+    rating = serializers.FloatField()
     specifications = ProductSpecificationSerializer(many=True)
 
     class Meta:
@@ -106,32 +114,66 @@ class ProductSerializer(serializers.ModelSerializer):
         return obj.reviews.count()
 
 
-class SaleSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+class ProductShortSerializer(serializers.ModelSerializer):
+    """карточка продукта для каталога и корзины, ожидает Product.objects.for_list()"""
+
+    tags = TagSerializer(many=True)
+    images = ImageSerializer(source="card_images", many=True)
+    category = serializers.IntegerField(source="category_id")
+    rating = serializers.FloatField()
+    reviews = serializers.IntegerField(source="rating_count")
     salePrice = serializers.SerializerMethodField()
 
     class Meta:
-        model = Sale
-        fields = ["product", "salePrice", "date_from", "date_to"]
+        model = Product
+        fields = (
+            "id",
+            "category",
+            "price",
+            "salePrice",
+            "count",
+            "date",
+            "title",
+            "free_delivery",
+            "images",
+            "tags",
+            "reviews",
+            "rating",
+        )
 
-    def get_salePrice(self, obj: Sale) -> Decimal:
-        return obj.product.price - obj.discount
+    def get_salePrice(self, obj: Product) -> Decimal:
+        return obj.effective_price
 
-    def to_representation(self, instance: Sale) -> dict:
-        ret = super().to_representation(instance)
-        product_data = ret["product"]
-        images = product_data.pop("images", [])
-        del ret["product"]
-        ret["images"] = images
-        ret["id"] = product_data["id"]
-        ret["price"] = product_data["price"]
-        ret["title"] = product_data["title"]
-        ret["dateFrom"] = ret["date_from"]
-        ret["dateTo"] = ret["date_to"]
-        return ret
 
+class SaleSerializer(serializers.ModelSerializer):
+    """карточка распродажи, ожидает Sale.objects.for_list()"""
 
+    salePrice = serializers.SerializerMethodField()
+    images = ImageSerializer(source="product.images", many=True)
+    id = serializers.IntegerField(source="product_id")
+    price = serializers.DecimalField(
+        source="product.price", max_digits=8, decimal_places=2
+    )
+    title = serializers.CharField(source="product.title")
+    dateFrom = serializers.DateField(source="date_from")
+    dateTo = serializers.DateField(source="date_to")
 
+    class Meta:
+        model = Sale
+        fields = [
+            "salePrice",
+            "date_from",
+            "date_to",
+            "images",
+            "id",
+            "price",
+            "title",
+            "dateFrom",
+            "dateTo",
+        ]
+
+    def get_salePrice(self, obj: Sale) -> Decimal:
+        return obj.product.price - obj.discount
 
 
 class BasketItemSerializer(serializers.ModelSerializer):
@@ -144,11 +186,28 @@ class BasketItemSerializer(serializers.ModelSerializer):
         )
 
     def to_representation(self, instance: BasketItem) -> dict:
-        data = ProductSerializer(instance.product).data
+        data = ProductShortSerializer(instance.product).data
         data["count"] = instance.quantity
         return data
 
 
+class BasketChangeSerializer(serializers.Serializer):
+    """одно изменение позиции для пакетного изменения корзины"""
+
+    ACTIONS = ("add", "set", "remove")
+
+    id = serializers.IntegerField()
+    count = serializers.IntegerField(min_value=0)
+    action = serializers.ChoiceField(choices=ACTIONS, default="add")
+
+    def validate(self, attrs: dict[str:any]) -> dict[str:any]:
+        if attrs["action"] != "set" and attrs["count"] == 0:
+            raise serializers.ValidationError(
+                {"count": "Количество должно быть больше нуля"}
+            )
+        return attrs
+
+
 class OrderSerializer(serializers.ModelSerializer):
 
     products = ProductSerializer(many=True)
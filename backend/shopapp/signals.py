@@ -0,0 +1,418 @@
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    pre_delete,
+    pre_save,
+    post_save,
+    post_delete,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+from mptt.signals import node_moved
+
+from backend.images import needs_variants, schedule_variants, variants_generated
+from myauth.models import ProfileUser
+
+from .models import (
+    Category,
+    Product,
+    ProductDocument,
+    ProductImage,
+    Review,
+    Sale,
+    Specification,
+    Tag,
+    stock_changed,
+)
+from .cache import CATALOG, CATEGORY_TREE, HOMEPAGE, bump_version
+from .catalog_index import get_catalog_index
+from .documents import refresh_documents
+from .search import get_search_backend
+from .suggest import suggest_index
+
+
+@receiver(pre_save, sender=Product)
+def set_effective_price(sender, instance: Product, raw: bool = False, **kwargs) -> None:
+    """цена с учетом скидки пересчитывается при каждом сохранении продукта"""
+    if not raw:
+        instance.effective_price = instance.get_effective_price()
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rate(
+    sender, instance: Review, raw: bool = False, **kwargs
+) -> None:
+    """запоминает товар и оценку отзыва до изменения"""
+    instance._previous_rate = None
+    if raw or instance._state.adding:
+        return
+    instance._previous_rate = (
+        Review.objects.filter(pk=instance.pk).values_list("product_id", "rate").first()
+    )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_review_save(
+    sender, instance: Review, raw: bool = False, **kwargs
+) -> None:
+    """обновляет агрегаты рейтинга продукта при создании и изменении отзыва"""
+    if raw:
+        return
+    rate = int(instance.rate)
+    previous = getattr(instance, "_previous_rate", None)
+    with transaction.atomic():
+        if previous is None:
+            Product.apply_rating_delta(instance.product_id, rate, 1)
+        elif previous[0] == instance.product_id:
+            Product.apply_rating_delta(instance.product_id, rate - previous[1], 0)
+        else:
+            Product.apply_rating_delta(previous[0], -previous[1], -1)
+            Product.apply_rating_delta(instance.product_id, rate, 1)
+            refresh_catalog_index([previous[0]])
+    refresh_catalog_index([instance.product_id])
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_review_delete(sender, instance: Review, **kwargs) -> None:
+    """обновляет агрегаты рейтинга продукта при удалении отзыва"""
+    Product.apply_rating_delta(instance.product_id, -int(instance.rate), -1)
+    refresh_catalog_index([instance.product_id])
+
+
+def reindex_products(product_ids: list[int]) -> None:
+    """переиндексирует продукты для поиска после фиксации транзакции"""
+    transaction.on_commit(lambda: get_search_backend().update(product_ids))
+
+
+@receiver(post_save, sender=Product)
+def reindex_saved_product(
+    sender, instance: Product, raw: bool = False, **kwargs
+) -> None:
+    if not raw:
+        reindex_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance: Product, **kwargs) -> None:
+    product_id = instance.pk
+    transaction.on_commit(lambda: get_search_backend().remove([product_id]))
+
+
+def tags_change_product_ids(
+    instance, action: str, reverse: bool, pk_set: set | None
+) -> list[int]:
+    """продукты, чьи теги меняет событие m2m_changed, в обе стороны связи"""
+    if reverse:
+        if action == "pre_clear":
+            return list(instance.tags.values_list("pk", flat=True))
+        if action in ("post_add", "post_remove") and pk_set:
+            return list(pk_set)
+    elif action.startswith("post_"):
+        return [instance.pk]
+    return []
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def reindex_product_tags(
+    sender, instance, action: str, reverse: bool, pk_set: set | None, **kwargs
+) -> None:
+    product_ids = tags_change_product_ids(instance, action, reverse, pk_set)
+    if product_ids:
+        reindex_products(product_ids)
+
+
+@receiver(pre_delete, sender=Tag)
+def reindex_deleted_tag_products(sender, instance: Tag, **kwargs) -> None:
+    reindex_products(tag_product_ids(instance))
+
+
+def tag_product_ids(tag: Tag) -> list[int]:
+    return list(tag.tags.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Tag)
+def reindex_renamed_tag_products(
+    sender, instance: Tag, created: bool = False, raw: bool = False, **kwargs
+) -> None:
+    """название тега входит в поисковый документ его продуктов"""
+    if not raw and not created:
+        reindex_products(tag_product_ids(instance))
+
+
+@receiver(post_save, sender=Specification)
+@receiver(post_delete, sender=Specification)
+def reindex_specification_product(
+    sender, instance: Specification, raw: bool = False, **kwargs
+) -> None:
+    if not raw and instance.product_id is not None:
+        reindex_products([instance.product_id])
+
+
+SUGGEST_KINDS = {
+    Product: ("product", "title"),
+    Tag: ("tag", "name"),
+    Category: ("category", "title"),
+}
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Category)
+def update_suggestions_on_save(sender, instance, raw: bool = False, **kwargs) -> None:
+    """публикует изменение для индексов подсказок всех процессов после коммита"""
+    if raw:
+        return
+    kind, title_attr = SUGGEST_KINDS[sender]
+    pk, title = instance.pk, getattr(instance, title_attr)
+    transaction.on_commit(lambda: suggest_index.publish(kind, pk, title))
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Category)
+def update_suggestions_on_delete(sender, instance, **kwargs) -> None:
+    kind, _ = SUGGEST_KINDS[sender]
+    pk = instance.pk
+    transaction.on_commit(lambda: suggest_index.publish(kind, pk, None))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(m2m_changed, sender=Product.tags.through)
+def invalidate_catalog_cache(sender, **kwargs) -> None:
+    """сбрасывает закэшированные фасеты каталога"""
+    transaction.on_commit(lambda: bump_version(CATALOG))
+
+
+def refresh_catalog_index(product_ids: list[int], titles_changed: bool = False) -> None:
+    """обновляет строки продуктов в колоночном индексе каталога после коммита"""
+    catalog_index = get_catalog_index()
+    if catalog_index is not None:
+        transaction.on_commit(
+            lambda: catalog_index.refresh(product_ids, titles_changed)
+        )
+
+
+@receiver(pre_save, sender=Product)
+def remember_title_change(
+    sender, instance: Product, raw: bool = False, **kwargs
+) -> None:
+    """смена названия двигает ранги сортировки по названию в индексе каталога"""
+    instance._title_changed = False
+    if raw or instance._state.adding or get_catalog_index() is None:
+        return
+    previous = (
+        Product.objects.filter(pk=instance.pk).values_list("title", flat=True).first()
+    )
+    instance._title_changed = previous != instance.title
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def refresh_catalog_index_on_product_change(
+    sender, instance: Product, raw: bool = False, **kwargs
+) -> None:
+    if not raw:
+        refresh_catalog_index([instance.pk], getattr(instance, "_title_changed", False))
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def refresh_catalog_index_on_tags_change(
+    sender, instance, action: str, reverse: bool, pk_set: set | None, **kwargs
+) -> None:
+    product_ids = tags_change_product_ids(instance, action, reverse, pk_set)
+    if product_ids:
+        refresh_catalog_index(product_ids)
+
+
+@receiver(post_save, sender=Tag)
+def refresh_catalog_index_on_tag_rename(
+    sender, instance: Tag, created: bool = False, raw: bool = False, **kwargs
+) -> None:
+    if not raw and not created:
+        refresh_catalog_index(tag_product_ids(instance))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def rebuild_catalog_index_on_category_change(sender, **kwargs) -> None:
+    """перемещение категории сдвигает lft/rght у многих продуктов, индекс строится заново"""
+    catalog_index = get_catalog_index()
+    if catalog_index is not None:
+        transaction.on_commit(catalog_index.rebuild)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(node_moved, sender=Category)
+def invalidate_category_tree_cache(sender, **kwargs) -> None:
+    """сбрасывает закэшированные границы поддеревьев категорий"""
+    transaction.on_commit(lambda: bump_version(CATEGORY_TREE))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(m2m_changed, sender=Product.tags.through)
+def invalidate_homepage_cache(sender, **kwargs) -> None:
+    """сбрасывает закэшированные списки главной страницы"""
+    transaction.on_commit(lambda: bump_version(HOMEPAGE))
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+def sync_effective_price_on_sale_change(
+    sender, instance: Sale, raw: bool = False, **kwargs
+) -> None:
+    """переносит изменение скидки в Product.effective_price"""
+    if raw:
+        return
+    if Product.sync_effective_prices([instance.product_id]):
+        refresh_catalog_index([instance.product_id])
+        transaction.on_commit(lambda: bump_version(CATALOG))
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Specification)
+@receiver(post_delete, sender=Specification)
+def touch_product_on_related_change(
+    sender, instance, raw: bool = False, **kwargs
+) -> None:
+    """картинки и характеристики входят в ответ продукта, меняют его updated_at"""
+    if not raw and instance.product_id is not None:
+        Product.touch([instance.product_id])
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def touch_products_on_tags_change(
+    sender, instance, action: str, reverse: bool, pk_set: set | None, **kwargs
+) -> None:
+    product_ids = tags_change_product_ids(instance, action, reverse, pk_set)
+    if product_ids:
+        Product.touch(product_ids)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_products_on_tag_change(
+    sender, instance: Tag, raw: bool = False, **kwargs
+) -> None:
+    if not raw and instance.pk is not None:
+        Product.touch(list(instance.tags.values_list("pk", flat=True)))
+
+
+@receiver(node_moved, sender=Category)
+def touch_moved_category(sender, instance: Category, **kwargs) -> None:
+    """перемещение узла mptt не вызывает save, updated_at ставится вручную"""
+    Category.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+
+
+def refresh_product_documents(product_ids: list[int]) -> None:
+    """удаляет устаревшие документы продуктов сразу, новые строит после коммита;
+    до перестройки документ соберется при первом чтении"""
+    ProductDocument.objects.filter(product_id__in=product_ids).delete()
+    transaction.on_commit(lambda: refresh_documents(product_ids))
+
+
+@receiver(post_save, sender=Product)
+def refresh_saved_product_document(
+    sender, instance: Product, raw: bool = False, **kwargs
+) -> None:
+    if not raw:
+        refresh_product_documents([instance.pk])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Specification)
+@receiver(post_delete, sender=Specification)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+def refresh_related_product_document(
+    sender, instance, raw: bool = False, **kwargs
+) -> None:
+    if not raw and instance.product_id is not None:
+        refresh_product_documents([instance.product_id])
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def refresh_documents_on_tags_change(
+    sender, instance, action: str, reverse: bool, pk_set: set | None, **kwargs
+) -> None:
+    product_ids = tags_change_product_ids(instance, action, reverse, pk_set)
+    if product_ids:
+        refresh_product_documents(product_ids)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def refresh_documents_on_tag_change(
+    sender, instance: Tag, raw: bool = False, **kwargs
+) -> None:
+    if not raw and instance.pk is not None:
+        refresh_product_documents(list(instance.tags.values_list("pk", flat=True)))
+
+
+@receiver(post_save, sender=ProfileUser)
+def refresh_documents_on_author_change(
+    sender, instance: ProfileUser, raw: bool = False, **kwargs
+) -> None:
+    """имя автора входит в отзывы документов продуктов"""
+    if raw:
+        return
+    product_ids = list(
+        Review.objects.filter(author=instance)
+        .order_by()
+        .values_list("product_id", flat=True)
+        .distinct()
+    )
+    if product_ids:
+        Product.touch(product_ids)
+        refresh_product_documents(product_ids)
+
+
+@receiver(stock_changed, sender=Product)
+def refresh_products_on_stock_change(
+    sender, product_ids: list[int], **kwargs
+) -> None:
+    """после списания остатков документы, индекс каталога и кэши - одной пачкой"""
+    refresh_product_documents(product_ids)
+    refresh_catalog_index(product_ids)
+    transaction.on_commit(lambda: bump_version(CATALOG))
+    transaction.on_commit(lambda: bump_version(HOMEPAGE))
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=Category)
+def schedule_image_variants(sender, instance, raw: bool = False, **kwargs) -> None:
+    """новое изображение получает уменьшенные копии в фоновом пуле"""
+    if not raw and needs_variants(instance):
+        schedule_variants(instance)
+
+
+@receiver(variants_generated, sender=ProductImage)
+def refresh_product_on_image_variants(sender, instance: ProductImage, **kwargs) -> None:
+    """варианты картинки входят в документы продукта и списки главной"""
+    Product.touch([instance.product_id])
+    refresh_product_documents([instance.product_id])
+    transaction.on_commit(lambda: bump_version(HOMEPAGE))
+
+
+@receiver(variants_generated, sender=Category)
+def refresh_category_on_image_variants(sender, instance: Category, **kwargs) -> None:
+    Category.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+    transaction.on_commit(lambda: bump_version(CATEGORY_TREE))
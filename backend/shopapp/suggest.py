@@ -0,0 +1,136 @@
+import bisect
+import threading
+
+from django.core.cache import cache
+
+from .cache import SUGGEST, bump_version, get_version
+from .models import Category, Product, Tag
+
+# сколько хранится изменение в общем журнале и сколько изменений процесс
+# догоняет по журналу; отставший сильнее процесс перечитывает индекс из базы
+CHANGE_TIMEOUT = 60 * 60
+MAX_CHANGES = 1000
+
+
+class SuggestIndex:
+    """Префиксный индекс подсказок для строки поиска.
+
+    Хранит отсортированный список ключей (нормализованное название и каждый
+    его хвост, начинающийся с нового слова), поиск по префиксу - bisect.
+    Загружается из базы один раз, дальше обновляется по журналу изменений в
+    общем кэше: сигналы после коммита пишут туда изменение под новой версией
+    пространства SUGGEST, и каждый процесс при запросе подсказок догоняет
+    версию, применяя пропущенные изменения. Запросы подсказок в базу не ходят.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.version: int | None = None
+        self.keys: list[tuple[str, str, int]] = []
+        self.items: dict[tuple[str, int], tuple[str, list[tuple[str, str, int]]]] = {}
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.lower().replace("ё", "е").split())
+
+    def make_keys(self, kind: str, pk: int, title: str) -> list[tuple[str, str, int]]:
+        words = self.normalize(title).split(" ")
+        return [(" ".join(words[i:]), kind, pk) for i in range(len(words)) if words[i]]
+
+    def _add(self, kind: str, pk: int, title: str) -> None:
+        self._remove(kind, pk)
+        keys = self.make_keys(kind, pk, title)
+        for key in keys:
+            bisect.insort(self.keys, key)
+        self.items[(kind, pk)] = (title, keys)
+
+    def _remove(self, kind: str, pk: int) -> None:
+        _, keys = self.items.pop((kind, pk), ("", []))
+        for key in keys:
+            position = bisect.bisect_left(self.keys, key)
+            if position < len(self.keys) and self.keys[position] == key:
+                del self.keys[position]
+
+    def load(self) -> None:
+        # версия читается до базы: изменения после нее применятся повторно
+        version = get_version(SUGGEST)
+        entries = [
+            *(
+                ("product", pk, title)
+                for pk, title in Product.objects.values_list("pk", "title")
+            ),
+            *(("tag", pk, name) for pk, name in Tag.objects.values_list("pk", "name")),
+            *(
+                ("category", pk, title)
+                for pk, title in Category.objects.values_list("pk", "title")
+            ),
+        ]
+        keys = []
+        items = {}
+        for kind, pk, title in entries:
+            item_keys = self.make_keys(kind, pk, title)
+            keys.extend(item_keys)
+            items[(kind, pk)] = (title, item_keys)
+        keys.sort()
+        with self.lock:
+            self.keys = keys
+            self.items = items
+            self.loaded = True
+            self.version = version
+
+    @staticmethod
+    def publish(kind: str, pk: int, title: str | None) -> None:
+        """записывает изменение (title=None - удаление) в общий журнал"""
+        version = bump_version(SUGGEST)
+        if version is not None:
+            cache.set(f"suggest:change:{version}", (kind, pk, title), CHANGE_TIMEOUT)
+
+    def sync(self) -> None:
+        """догоняет общую версию по журналу или перечитывает индекс из базы"""
+        version = get_version(SUGGEST)
+        if self.loaded and version == self.version:
+            return
+        changes = None
+        if self.loaded and 0 < version - self.version <= MAX_CHANGES:
+            keys = [
+                f"suggest:change:{number}"
+                for number in range(self.version + 1, version + 1)
+            ]
+            found = cache.get_many(keys)
+            if len(found) == len(keys):
+                changes = [found[key] for key in keys]
+        if changes is None:
+            self.load()
+            return
+        with self.lock:
+            for kind, pk, title in changes:
+                if title is None:
+                    self._remove(kind, pk)
+                else:
+                    self._add(kind, pk, title)
+            self.version = version
+
+    def suggest(self, query: str, limit: int = 10) -> list[dict[str:any]]:
+        """подсказки, у которых название или одно из его слов начинается с query"""
+        prefix = self.normalize(query)
+        if not prefix:
+            return []
+        self.sync()
+        suggestions = []
+        seen = set()
+        with self.lock:
+            position = bisect.bisect_left(self.keys, (prefix,))
+            while position < len(self.keys) and len(suggestions) < limit:
+                key, kind, pk = self.keys[position]
+                if not key.startswith(prefix):
+                    break
+                if (kind, pk) not in seen:
+                    seen.add((kind, pk))
+                    title, _ = self.items[(kind, pk)]
+                    suggestions.append({"type": kind, "id": pk, "title": title})
+                position += 1
+        return suggestions
+
+
+suggest_index = SuggestIndex()
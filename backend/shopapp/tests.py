@@ -2,14 +2,51 @@ from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
 from django.contrib.auth.models import User
-from .models import Category, Product, Tag, ProductImage, Specification, Order, DeliveryPrice
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+import datetime
+import decimal
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from django.core.management import call_command
+from rest_framework.renderers import JSONRenderer
+from api.renderers import ORJSONRenderer
+from backend.compression import CompressionMiddleware
+from backend.files import serve_media
+from backend.staticfiles import CompressedManifestStaticFilesStorage, CompressedStaticFilesStorage, serve_static
+from .catalog_index import get_catalog_index
+from .models import POPULARITY_EPOCH, Basket, BasketItem, Category, Product, ProductDocument, ProductQuerySet, Sale, Tag, ProductImage, Specification, Order, DeliveryPrice, Review
+from .search import get_search_backend
+from .suggest import SuggestIndex, suggest_index
 from .serializers import CategorySerializer, ProductSerializer, OrderSerializer
+from .views import CatalogView
 from myauth.models import ProfileUser
 from myauth.serializers import ProfileSerializer
 
+# загруженные в тестах изображения и их варианты не попадают в media проекта
+TEST_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, IMAGE_VARIANT_WORKERS=0)
 class ShopAppTests(APITestCase):
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
     def setUp(self) -> None:
-        
+        # версии кэша сдвигаются только после коммита, которого в тестах нет
+        cache.clear()
         self.one_category = Category.objects.create(
             title='Комплектующие для ПК'
         )
@@ -73,6 +110,26 @@ class ShopAppTests(APITestCase):
         )
         self.assertEqual(response.data, categories_serialized.data)
 
+    def test_categories_tree_is_cached(self):
+        Category.objects.create(title='Процессоры', parent=self.one_category)
+        Category.objects.create(title='Периферия')
+        expected = CategorySerializer(Category.get_categories(), many=True).data
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('categories'))
+        self.assertEqual(expected, response.data)
+        self.assertEqual(1, sum(query['sql'].startswith('SELECT "shopapp_category"."id"') for query in queries))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('categories'))
+        self.assertFalse(any(query['sql'].startswith('SELECT "shopapp_category"."id"') for query in queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.one_subcategory.move_to(None)
+            # до коммита версия не меняется и кэш отдает прежнее дерево
+            self.assertEqual(2, len(self.client.get(reverse('categories')).data))
+        response = self.client.get(reverse('categories'))
+        self.assertEqual(CategorySerializer(Category.get_categories(), many=True).data, response.data)
+        self.assertEqual(3, len(response.data))
+
     def test_get_product_detail(self):
         product_detail_url = reverse('product-detail', kwargs={'product_id': 1})
         product = Product.objects.get(pk=1)
@@ -106,6 +163,247 @@ class ShopAppTests(APITestCase):
         )
         self.assertIn('Good', response.data['reviews'][0]['text'])
 
+    def test_review_rating_aggregates(self):
+        user = User.objects.get(username='Test')
+        profile = ProfileUser.objects.get(user=user)
+        review = Review.objects.create(author=profile, product=self.one_product, rate=5)
+        Review.objects.create(author=profile, product=self.one_product, rate=2)
+        self.one_product.refresh_from_db()
+        self.assertEqual((7, 2), (self.one_product.rating_sum, self.one_product.rating_count))
+        self.assertEqual(3.5, float(self.one_product.rating))
+
+        review.rate = 3
+        review.save()
+        self.one_product.refresh_from_db()
+        self.assertEqual(2.5, float(self.one_product.rating))
+
+        review.delete()
+        self.one_product.refresh_from_db()
+        self.assertEqual((2, 1), (self.one_product.rating_sum, self.one_product.rating_count))
+
+        other = Product.objects.create(category=self.one_subcategory, price=100, count=1, title='Кулер')
+        Product.objects.filter(pk=self.one_product.pk).update(rating_sum=0, rating_count=0, rating=0)
+        # UPDATE без сигналов: кэш главной сбрасывает сама команда
+        banners = lambda: [item['id'] for item in self.client.get(reverse('banners')).data]
+        self.assertEqual([], banners())
+        other_updated_at = Product.objects.get(pk=other.pk).updated_at
+        out = io.StringIO()
+        call_command('recalculate_ratings', stdout=out)
+        self.assertIn('1', out.getvalue())
+        self.one_product.refresh_from_db()
+        self.assertEqual(2.0, float(self.one_product.rating))
+        self.assertEqual([self.one_product.pk], banners())
+        self.assertEqual(other_updated_at, Product.objects.get(pk=other.pk).updated_at)
+
+    def test_catalog_query_count_is_constant(self):
+        profile = ProfileUser.objects.get(user__username='Test')
+        catalog_url = reverse('catalog')
+        with CaptureQueriesContext(connection) as one_product_queries:
+            self.client.get(catalog_url)
+        for i in range(5):
+            product = Product.objects.create(category=self.one_subcategory, price=100 + i, count=1, title=f'RX {i}')
+            product.tags.add(self.one_tag)
+            ProductImage.objects.create(product=product)
+            Specification.objects.create(name='Видеопамять', value='8GB', product=product)
+            Review.objects.create(author=profile, product=product, text='Ok', rate=4)
+        with CaptureQueriesContext(connection) as many_products_queries:
+            response = self.client.get(catalog_url)
+        self.assertEqual(6, len(response.data['items']))
+        self.assertEqual(len(one_product_queries), len(many_products_queries))
+
+    def test_catalog_returns_short_cards(self):
+        response = self.client.get(reverse('catalog'))
+        card = response.data['items'][0]
+        self.assertNotIn('description', card)
+        self.assertNotIn('specifications', card)
+        self.assertEqual(0, card['reviews'])
+        self.assertEqual(1, len(card['images']))
+        self.assertEqual([{'name': 'AMD'}, {'name': 'popular'}], card['tags'])
+
+    def test_catalog_cursor_pagination(self):
+        for i in range(4):
+            Product.objects.create(category=self.one_subcategory, price=1000, count=1, title=f'RX {i}')
+        expected = list(Product.objects.order_by('-price', '-id').values_list('id', flat=True))
+        params = {'pagination': 'cursor', 'sort': 'price', 'sortType': 'dec', 'limit': 2}
+        response = self.client.get(reverse('catalog'), params)
+        self.assertIsNone(response.data['prev'])
+        pages = [response.data]
+        while pages[-1]['next']:
+            pages.append(self.client.get(pages[-1]['next']).data)
+        self.assertEqual(expected, [item['id'] for page in pages for item in page['items']])
+        response = self.client.get(pages[-1]['prev'])
+        self.assertEqual(pages[-2]['items'], response.data['items'])
+
+        response = self.client.get(reverse('catalog'), {'cursor': 'broken'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for params in ({'limit': 0}, {'limit': 'x'}, {'currentPage': 'x'}):
+            response = self.client.get(reverse('catalog'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.get(reverse('sales'), params).status_code)
+
+    def test_catalog_search(self):
+        other = Product.objects.create(
+            category=self.one_subcategory, price=500, count=1, title='Кулер',
+            description='Подходит для видеокарт AMD'
+        )
+        search_backend = get_search_backend()
+        search_backend.rebuild()
+        response = self.client.get(reverse('catalog'), {'filter[name]': 'amd', 'sort': 'relevance'})
+        self.assertEqual([self.one_product.pk, other.pk], [item['id'] for item in response.data['items']])
+
+        response = self.client.get(reverse('catalog'), {'filter[name]': 'видеопамяти'})
+        self.assertEqual([self.one_product.pk], [item['id'] for item in response.data['items']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.title = 'Кулер Arctic'
+            other.save()
+        response = self.client.get(reverse('catalog'), {'filter[name]': 'arctic'})
+        self.assertEqual([other.pk], [item['id'] for item in response.data['items']])
+
+        for i in range(4):
+            Product.objects.create(category=self.one_subcategory, price=100, count=1, title=f'Кулер AMD {i}')
+        search_backend.rebuild()
+        found = search_backend.search(Product.objects.all(), 'amd')
+        expected = list(found.order_by('-relevance', '-id').values_list('id', flat=True))
+        params = {'pagination': 'cursor', 'sort': 'relevance', 'filter[name]': 'amd', 'limit': 2}
+        pages = [self.client.get(reverse('catalog'), params).data]
+        while pages[-1]['next']:
+            pages.append(self.client.get(pages[-1]['next']).data)
+        self.assertEqual(expected, [item['id'] for page in pages for item in page['items']])
+        self.assertEqual(pages[-2]['items'], self.client.get(pages[-1]['prev']).data['items'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.one_tag.name = 'Geforce'
+            self.one_tag.save()
+        response = self.client.get(reverse('catalog'), {'filter[name]': 'geforce'})
+        self.assertEqual([self.one_product.pk], [item['id'] for item in response.data['items']])
+
+    def test_search_suggest(self):
+        suggest_index.load()
+        # индекс другого процесса сервера
+        other_index = SuggestIndex()
+        other_index.load()
+        suggest_url = reverse('search-suggest')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(suggest_url, {'q': 'RX 77'})
+        self.assertEqual(0, len(queries))
+        self.assertEqual([{'type': 'product', 'id': self.one_product.pk, 'title': 'AMD RX 7700XT'}], response.data)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(name='Видеокарты RTX')
+        response = self.client.get(suggest_url, {'q': 'видео'})
+        self.assertEqual(
+            [('category', self.one_subcategory.pk), ('tag', tag.pk)],
+            [(item['type'], item['id']) for item in response.data]
+        )
+        self.assertEqual(1, len(self.client.get(suggest_url, {'q': 'видео', 'limit': 0}).data))
+        response = self.client.get(suggest_url, {'q': 'видео', 'limit': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with self.assertNumQueries(0):
+            self.assertEqual(['Видеокарты', 'Видеокарты RTX'], [item['title'] for item in other_index.suggest('видео')])
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.delete()
+        self.assertEqual(['Видеокарты'], [item['title'] for item in other_index.suggest('видео')])
+
+    def test_catalog_facets(self):
+        Product.objects.create(category=self.one_category, price=300, count=0, title='Корпус', free_delivery=False)
+        response = self.client.get(reverse('catalog'), {'facets': 'true'})
+        facets = response.data['facets']
+        self.assertEqual(2, facets['total'])
+        self.assertEqual({'min': 300, 'max': 1000}, facets['price'])
+        self.assertEqual((1, 1), (facets['freeDelivery'], facets['available']))
+        self.assertEqual(
+            [{'id': self.one_tag.pk, 'name': 'AMD', 'count': 1}, {'id': self.popular_tag.pk, 'name': 'popular', 'count': 1}],
+            facets['tags']
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('catalog'), {'facets': 'true', 'currentPage': 2})
+        self.assertFalse(any('MIN(' in query['sql'] for query in queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.one_product.tags.remove(self.popular_tag)
+        response = self.client.get(reverse('catalog'), {'facets': 'true'})
+        self.assertEqual(['AMD'], [tag['name'] for tag in response.data['facets']['tags']])
+
+    def test_catalog_category_subtree(self):
+        other = Category.objects.create(title='Периферия')
+        response = self.client.get(reverse('catalog'), {'category': self.one_category.pk})
+        self.assertEqual([self.one_product.pk], [item['id'] for item in response.data['items']])
+        response = self.client.get(reverse('catalog'), {'category': 999})
+        self.assertEqual([], response.data['items'])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('catalog'), {'category': self.one_category.pk})
+        self.assertFalse(any(query['sql'].startswith('SELECT "shopapp_category"."id"') for query in queries))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.one_subcategory.move_to(other)
+        response = self.client.get(reverse('catalog'), {'category': other.pk})
+        self.assertEqual([self.one_product.pk], [item['id'] for item in response.data['items']])
+        response = self.client.get(reverse('catalog'), {'category': self.one_category.pk})
+        self.assertEqual([], response.data['items'])
+
+    def test_catalog_sort_uses_indexes(self):
+        Product.objects.bulk_create(
+            Product(category=self.one_subcategory, price=i % 97, count=i % 3, title=f'Товар {i}', rating=(i % 50) / 10)
+            for i in range(500)
+        )
+        scan, sort = ('USING', 'TEMP B-TREE') if connection.vendor == 'sqlite' else ('Index', 'Sort')
+        combinations = [{'sort': sort_name, 'sortType': sort_type} for sort_name in ProductQuerySet.SORT_FIELDS for sort_type in ('inc', 'dec')]
+        combinations += [
+            {'sort': 'price', 'filter[available]': 'true'},
+            {'sort': 'rating', 'sortType': 'dec', 'filter[available]': 'true'},
+            {'sort': 'price', 'filter[minPrice]': 10, 'filter[maxPrice]': 50},
+        ]
+        for params in combinations:
+            view = CatalogView()
+            view.request = RequestFactory().get(reverse('catalog'), params)
+            plan = view.filter_queryset(Product.objects.for_list())[:20].explain()
+            self.assertNotIn(sort, plan, params)
+            if params['sort'] != 'id':
+                self.assertIn(scan, plan.split('shopapp_sale')[0], params)
+
+        response = self.client.get(reverse('catalog'), {'sort': 'tags'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_catalog_index(self):
+        cheap = Product.objects.create(category=self.one_category, price=300, count=0, title='Корпус', free_delivery=False)
+        with tempfile.TemporaryDirectory() as path, override_settings(CATALOG_INDEX_ENABLED=True, CATALOG_INDEX_PATH=path):
+            get_catalog_index().rebuild()
+            for params in ({'sort': 'price', 'sortType': 'dec'}, {'sort': 'title'}, {'filter[freeDelivery]': 'true'}, {'tags[]': 'AMD'}):
+                with override_settings(CATALOG_INDEX_ENABLED=False):
+                    expected = self.client.get(reverse('catalog'), params).data['items']
+                self.assertEqual(expected, self.client.get(reverse('catalog'), params).data['items'])
+
+            # параметры фильтров разбираются один раз на запрос
+            with mock.patch.object(Category, 'get_subtree_bounds', wraps=Category.get_subtree_bounds) as bounds:
+                self.client.get(reverse('catalog'), {'category': self.one_category.pk})
+            bounds.assert_called_once()
+
+            index = get_catalog_index()
+            generation = index.generation
+            with self.captureOnCommitCallbacks(execute=True):
+                cheap.tags.add(self.one_tag)
+            response = self.client.get(reverse('catalog'), {'tags[]': 'AMD', 'sort': 'price'})
+            self.assertEqual([cheap.pk, self.one_product.pk], [item['id'] for item in response.data['items']])
+
+            # изменения существующих продуктов не трогают файлы, открытые читателями,
+            # и не запрашивают ранги названий, пока название не сменилось
+            index.load()
+            products = index.products
+            old_prices = products['price'].copy()
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                cheap.price = 2000
+                cheap.save()
+            self.assertFalse(any('ORDER BY "shopapp_product"."title"' in query['sql'] for query in queries))
+            self.assertEqual(old_prices.tolist(), products['price'].tolist())
+            self.assertLess(generation, index.read_meta()['generation'])
+            with self.captureOnCommitCallbacks(execute=True):
+                cheap.title = 'A4Tech'
+                cheap.save()
+            for params in ({'sort': 'price'}, {'sort': 'title'}, {'tags[]': 'AMD', 'sort': 'title'}):
+                with override_settings(CATALOG_INDEX_ENABLED=False):
+                    expected = self.client.get(reverse('catalog'), params).data['items']
+                self.assertEqual(expected, self.client.get(reverse('catalog'), params).data['items'])
 
     def test_get_popular_products(self):
         popular_products_url = reverse('products-popular')
@@ -114,6 +412,22 @@ class ShopAppTests(APITestCase):
         )
         self.assertEqual(1, len(response.data))
 
+    def test_homepage_lists_are_cached(self):
+        popular_products_url = reverse('products-popular')
+        self.client.get(popular_products_url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(popular_products_url)
+        self.assertFalse(any('shopapp_product' in query['sql'] for query in queries))
+        self.assertEqual(1, len(response.data))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(category=self.one_category, price=300, count=1, title='Корпус')
+        self.assertEqual(2, len(self.client.get(popular_products_url).data))
+        self.client.get(reverse('banners'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(author=ProfileUser.objects.get(user__username='Test'), text='ok', rate=5, product=product)
+        self.assertEqual(5, self.client.get(reverse('banners')).data[0]['rating'])
+
     def test_basket(self):
         user = User.objects.get(username='Test')
         self.client.force_authenticate(user=user) 
@@ -188,11 +502,14 @@ class ShopAppTests(APITestCase):
         )
         self.assertEqual(response.json(), {'status': 'accepted'})
 
-        response = self.client.post(
-            payment_url,
-            {'number': 12345678, 'month': 12, 'year': 2025, 'code': 123, 'name': 'Test'}
-        )
+        # остатки списываются UPDATE-ом, без save и тяжелых сигналов на каждый продукт
+        with mock.patch.object(Product, 'save') as save:
+            response = self.client.post(
+                payment_url,
+                {'number': 12345678, 'month': 12, 'year': 2025, 'code': 123, 'name': 'Test'}
+            )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        save.assert_not_called()
 
         response = self.client.get(
             payment_url
@@ -205,6 +522,440 @@ class ShopAppTests(APITestCase):
         )
         self.assertEqual(5, response.data['count'])
 
+        other = Product.objects.create(category=self.one_category, price=300, count=1, title='Корпус')
+        self.assertFalse(Product.take_from_stock({self.one_product.pk: 1, other.pk: 2}))
+        self.assertEqual(5, Product.objects.get(pk=self.one_product.pk).count)
+
 
 
     
+
+    def test_order_total_keeps_basket_summary_precision(self):
+        server = Product.objects.create(category=self.one_category, price=decimal.Decimal('999999.99'), count=1000, title='Сервер')
+        self.client.force_authenticate(user=User.objects.get(username='Test'))
+        self.client.post(reverse('basket'), {'id': server.pk, 'count': 500})
+        summary = self.client.get(reverse('basket-summary')).data
+        response = self.client.post(reverse('orders'))
+        order = Order.objects.get(pk=response.json()['orderId'])
+        self.assertEqual(decimal.Decimal(str(summary['total'])), order.totalCost)
+
+    def test_popular_products_follow_paid_orders(self):
+        second = Product.objects.create(category=self.one_category, price=300, count=10, title='Корпус')
+        customer = ProfileUser.objects.get(user__username='Test')
+        basket, _ = Basket.objects.get_or_create(user=customer.user)
+        old_order = Order.objects.create(customer=customer, basket=basket, status='paid')
+        old_order.products.set([self.one_product])
+        Order.objects.filter(pk=old_order.pk).update(created_at=old_order.created_at - datetime.timedelta(days=30))
+
+        # UPDATE популярности не вызывает сигналов, кэш главной сбрасывается явно
+        popular = lambda: [item['id'] for item in self.client.get(reverse('products-popular')).data]
+        self.assertEqual([second.pk, self.one_product.pk], popular())
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.register_order([self.one_product.pk], datetime.datetime(2030, 1, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual([self.one_product.pk, second.pk], popular())
+
+        self.client.force_authenticate(user=User.objects.get(username='Test'))
+        self.client.post(reverse('basket'), {'id': second.pk, 'count': 1})
+        self.client.post(reverse('orders'))
+        order = Order.objects.latest('pk')
+        self.client.post(reverse('payment', kwargs={'order_id': order.pk}), {'number': 12345678, 'month': 12, 'year': 2099, 'code': 123, 'name': 'Test'})
+        second.refresh_from_db()
+        self.assertEqual(1, second.orders_count)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('recalculate_popularity', stdout=io.StringIO())
+        self.assertEqual([second.pk, self.one_product.pk], popular())
+        self.assertEqual([1, 1], list(Product.objects.order_by('-popularity').values_list('orders_count', flat=True)))
+
+        # заказ до точки отсчета дает отрицательный log2 веса, но продукт
+        # все равно выше продуктов, которых не заказывали
+        old_product = Product.objects.create(category=self.one_category, price=50, count=1, title='Кабель')
+        never_ordered = Product.objects.create(category=self.one_category, price=50, count=1, title='Мышь')
+        Product.register_order([old_product.pk], datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc))
+        old_product.refresh_from_db()
+        self.assertLess(old_product.popularity, 0)
+        ranking = list(Product.objects.order_by('-popularity', '-id').values_list('pk', flat=True))
+        self.assertLess(ranking.index(old_product.pk), ranking.index(never_ordered.pk))
+        Product.recalculate_popularity()
+        self.assertEqual(float('-inf'), Product.objects.get(pk=never_ordered.pk).popularity)
+
+        # popularity хранит log2 суммы весов и не переполняется даже через годы
+        far_future = datetime.datetime(2124, 1, 1, tzinfo=datetime.timezone.utc)
+        with override_settings(POPULARITY_HALF_LIFE_DAYS=1):
+            Product.register_order([second.pk], far_future)
+            Product.register_order([second.pk], far_future)
+        second.refresh_from_db()
+        days = (far_future - POPULARITY_EPOCH).total_seconds() / 86400
+        self.assertAlmostEqual(days + 1, second.popularity, places=6)
+
+    def test_sales_lists_only_active(self):
+        today = datetime.date.today()
+        Sale.objects.create(product=self.one_product, discount=100, date_from=today - datetime.timedelta(days=1), date_to=today + datetime.timedelta(days=1))
+        for i in range(3):
+            expired = Product.objects.create(category=self.one_category, price=300, count=1, title=f'Корпус {i}')
+            Sale.objects.create(product=expired, discount=50, date_from=today - datetime.timedelta(days=30), date_to=today - datetime.timedelta(days=10))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('sales'))
+        self.assertEqual(1, response.data['lastPage'])
+        self.assertEqual(
+            {'id': self.one_product.pk, 'price': '1000.00', 'salePrice': 900, 'title': 'AMD RX 7700XT', 'dateFrom': str(today - datetime.timedelta(days=1))},
+            {key: response.data['items'][0][key] for key in ('id', 'price', 'salePrice', 'title', 'dateFrom')}
+        )
+        self.assertEqual(1, len(response.data['items']))
+        self.assertEqual(1, len(response.data['items'][0]['images']))
+        self.assertEqual(3, sum('shopapp_' in query['sql'] for query in queries))
+
+    def test_effective_price_follows_sales(self):
+        today = datetime.date.today()
+        sale = Sale.objects.create(product=self.one_product, discount=100, date_from=today, date_to=today + datetime.timedelta(days=7))
+        response = self.client.get(reverse('catalog'), {'filter[maxPrice]': 950})
+        self.assertEqual([900], [item['salePrice'] for item in response.data['items']])
+
+        Sale.objects.filter(pk=sale.pk).update(date_from=today + datetime.timedelta(days=1))
+        call_command('activate_sales', stdout=io.StringIO())
+        response = self.client.get(reverse('catalog'), {'filter[maxPrice]': 950})
+        self.assertEqual([], response.data['items'])
+
+        # в режиме --forever пересчет идет сразу после полуночи, а не раз в час
+        command = 'shopapp.management.commands.activate_sales'
+        with mock.patch(f'{command}.time.sleep', side_effect=[None, KeyboardInterrupt]) as sleep, \
+                mock.patch(f'{command}.connection'), mock.patch.object(Product, 'sync_effective_prices', return_value=[]) as sync:
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('activate_sales', forever=True, stdout=io.StringIO())
+        self.assertEqual(2, sync.call_count)
+        self.assertTrue(all(0 < call.args[0] <= 24 * 60 * 60 + 1 for call in sleep.call_args_list))
+        sale.delete()
+        self.one_product.refresh_from_db()
+        self.assertEqual(1000, self.one_product.effective_price)
+
+    def test_conditional_requests(self):
+        product_detail_url = reverse('product-detail', kwargs={'product_id': self.one_product.pk})
+        response = self.client.get(product_detail_url)
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(product_detail_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        catalog_response = self.client.get(reverse('catalog'))
+        tags_response = self.client.get(reverse('tags'))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(
+                status.HTTP_304_NOT_MODIFIED,
+                self.client.get(reverse('catalog'), HTTP_IF_NONE_MATCH=catalog_response['ETag']).status_code
+            )
+        self.assertFalse([query for query in queries if 'shopapp_' in query['sql']])
+        self.assertIn('Accept', catalog_response['Vary'])
+        params = {'sort': 'price', 'limit': 2}
+        sorted_response = self.client.get(reverse('catalog'), params, HTTP_IF_NONE_MATCH=catalog_response['ETag'])
+        self.assertEqual(status.HTTP_200_OK, sorted_response.status_code)
+        self.assertEqual(
+            status.HTTP_304_NOT_MODIFIED,
+            self.client.get(
+                reverse('catalog') + '?limit=2&sort=price', HTTP_IF_NONE_MATCH=sorted_response['ETag']
+            ).status_code
+        )
+        response_html = self.client.get(
+            reverse('catalog'), HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=catalog_response['ETag']
+        )
+        self.assertEqual(status.HTTP_200_OK, response_html.status_code)
+        etag = response['ETag']
+        Review.objects.create(author=ProfileUser.objects.get(user__username='Test'), text='ok', rate=5, product=self.one_product)
+        response = self.client.get(product_detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(1, len(response.data['reviews']))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.one_product.tags.remove(self.one_tag)
+        response = self.client.get(reverse('catalog'), HTTP_IF_NONE_MATCH=catalog_response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Intel')
+        response = self.client.get(reverse('tags'), HTTP_IF_NONE_MATCH=tags_response['ETag'])
+        self.assertEqual(3, len(response.data))
+
+    def test_product_documents(self):
+        product_detail_url = reverse('product-detail', kwargs={'product_id': self.one_product.pk})
+        self.client.get(reverse('catalog'))
+        self.client.get(product_detail_url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('catalog'))
+            self.client.get(product_detail_url)
+        self.assertFalse(any('shopapp_productimage' in query['sql'] or 'shopapp_review' in query['sql'] for query in queries))
+        self.assertEqual([self.one_product.pk], [item['id'] for item in response.json()['items']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Specification.objects.create(product=self.one_product, name='Память', value='12 ГБ')
+        self.assertIn('12 ГБ', ProductDocument.objects.get(pk=self.one_product.pk).detail)
+        response = self.client.get(product_detail_url)
+        self.assertEqual(ProductSerializer(Product.objects.get(pk=self.one_product.pk)).data, response.json())
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get(reverse('product-detail', kwargs={'product_id': 999})).status_code)
+
+        profile = ProfileUser.objects.get(user__username='Test')
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(author=profile, product=self.one_product, text='ok', rate=5)
+        self.client.get(product_detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.name = 'Иван'
+            profile.save()
+        response = self.client.get(product_detail_url)
+        self.assertTrue(response.json()['reviews'][0]['author'].startswith('Иван'))
+
+    def test_orjson_renderer(self):
+        data = {
+            'price': decimal.Decimal('1000.50'),
+            'date': datetime.datetime(2024, 1, 2, 3, 4, 5, 600000, tzinfo=datetime.timezone.utc),
+            'day': datetime.date(2024, 1, 2),
+            'title': 'Видеокарта \u2028 AMD\u2029',
+            1: [None, True, 1.5],
+        }
+        self.assertEqual(JSONRenderer().render(data), ORJSONRenderer().render(data))
+        self.assertEqual(JSONRenderer().render(data, 'application/json; indent=4'), ORJSONRenderer().render(data, 'application/json; indent=4'))
+        for value in (1e20, 1e-05, 0.0001, 123.456, -0.0, decimal.Decimal('1E+20')):
+            self.assertEqual(JSONRenderer().render({'value': value}), ORJSONRenderer().render({'value': value}), value)
+        for value in (float('nan'), float('inf'), decimal.Decimal('NaN')):
+            with self.assertRaises(ValueError):
+                ORJSONRenderer().render({'value': [value]})
+
+        response = self.client.get(reverse('tags'))
+        self.assertIsInstance(response.accepted_renderer, ORJSONRenderer)
+        self.assertEqual(JSONRenderer().render(response.data), response.content)
+        response = self.client.get(reverse('catalog'), HTTP_ACCEPT='text/html')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(self.one_product.pk, response.data['items'][0]['id'])
+
+    def test_response_compression(self):
+        for number in range(20):
+            Product.objects.create(category=self.one_subcategory, price=100, count=1, title=f'Видеокарта {number}', description='Описание ' * 20)
+        response = self.client.get(reverse('catalog'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(20, len(json.loads(gzip.decompress(response.content))['items']))
+        self.assertFalse(self.client.get(reverse('catalog'), HTTP_ACCEPT_ENCODING='gzip;q=0').has_header('Content-Encoding'))
+        self.assertFalse(self.client.get(reverse('tags'), HTTP_ACCEPT_ENCODING='gzip').has_header('Content-Encoding'))
+
+        # HTML с csrf-токеном не сжимается brotli: у него нет заполнения против BREACH
+        brotli = mock.Mock(compress=lambda content, quality: b'br')
+        with mock.patch('backend.compression.brotli', brotli):
+            html = HttpResponse('<form>' * 500, content_type='text/html; charset=utf-8')
+            response = CompressionMiddleware(lambda request: html)(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='br, gzip'))
+            self.assertEqual('gzip', response['Content-Encoding'])
+            response = self.client.get(reverse('catalog'), HTTP_ACCEPT_ENCODING='br, gzip')
+            self.assertEqual(('br', b'br'), (response['Content-Encoding'], response.content))
+
+        with tempfile.TemporaryDirectory() as static_root, override_settings(STATIC_ROOT=static_root):
+            with open(f'{static_root}/app.css', 'w') as file:
+                file.write('.card { color: red; }\n' * 200)
+            list(CompressedStaticFilesStorage(location=static_root).post_process({}))
+            response = serve_static(RequestFactory().get('/static/app.css', HTTP_ACCEPT_ENCODING='br;q=0, gzip'), 'app.css')
+            self.assertEqual('gzip', response['Content-Encoding'])
+            self.assertEqual('text/css', response['Content-Type'])
+            self.assertEqual('.card { color: red; }\n' * 200, gzip.decompress(b''.join(response.streaming_content)).decode())
+            response.close()
+            response = serve_static(RequestFactory().get('/static/app.css'), 'app.css')
+            self.assertFalse(response.has_header('Content-Encoding'))
+            response.close()
+
+    def test_file_serving(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            with open(f'{media_root}/avatar.png', 'wb') as file:
+                file.write(b'0123456789')
+            response = serve_media(RequestFactory().get('/media/avatar.png', HTTP_RANGE='bytes=2-5'), 'avatar.png')
+            self.assertEqual(206, response.status_code)
+            self.assertEqual('bytes 2-5/10', response['Content-Range'])
+            self.assertEqual(b'2345', b''.join(response.streaming_content))
+            self.assertIn('max-age=86400', response['Cache-Control'])
+            response.close()
+            response = serve_media(RequestFactory().get('/media/avatar.png', HTTP_RANGE='bytes=-3'), 'avatar.png')
+            self.assertEqual(b'789', b''.join(response.streaming_content))
+            response.close()
+            self.assertEqual(416, serve_media(RequestFactory().get('/media/avatar.png', HTTP_RANGE='bytes=20-'), 'avatar.png').status_code)
+            with open(f'{media_root}/a.txt', 'w') as file:
+                file.write('x' * 6000)
+            response = self.client.get('/media/a.txt', HTTP_RANGE='bytes=0-99', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(206, response.status_code)
+            self.assertEqual('bytes 0-99/6000', response['Content-Range'])
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertEqual(b'x' * 100, b''.join(response.streaming_content))
+            response.close()
+            with override_settings(ACCEL_REDIRECT_PREFIX='/internal'):
+                response = serve_media(RequestFactory().get('/media/avatar.png'), 'avatar.png')
+                self.assertEqual('/internal/media/avatar.png', response['X-Accel-Redirect'])
+                self.assertEqual(b'', response.content)
+
+        storages = {'staticfiles': {'BACKEND': 'backend.staticfiles.CompressedManifestStaticFilesStorage'}}
+        with tempfile.TemporaryDirectory() as static_root, override_settings(STATIC_ROOT=static_root, STORAGES=storages):
+            with open(f'{static_root}/app.css', 'w') as file:
+                file.write('.card { color: red; }\n')
+            storage = CompressedManifestStaticFilesStorage()
+            list(storage.post_process({'app.css': (storage, 'app.css')}))
+            hashed_name = storage.stored_name('app.css')
+            self.assertNotEqual('app.css', hashed_name)
+            response = serve_static(RequestFactory().get(f'/static/{hashed_name}'), hashed_name)
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertIn('max-age=31536000', response['Cache-Control'])
+            response.close()
+            response = serve_static(RequestFactory().get('/static/app.css'), 'app.css')
+            self.assertNotIn('immutable', response['Cache-Control'])
+            response.close()
+
+    def test_image_variants(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1000, 500), 'red').save(buffer, 'JPEG')
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            with self.captureOnCommitCallbacks(execute=True):
+                image = ProductImage.objects.create(product=self.one_product, image=SimpleUploadedFile('card.jpg', buffer.getvalue()))
+            image.refresh_from_db()
+            self.assertEqual([200, 200, 400, 400, 800, 800], [item['width'] for item in image.image_variants['items']])
+            with Image.open(f"{media_root}/{image.image_variants['items'][0]['src']}") as variant:
+                self.assertEqual(('WEBP', (200, 100)), (variant.format, variant.size))
+
+            response = self.client.get(reverse('product-detail', kwargs={'product_id': self.one_product.pk}))
+            variants = response.json()['images'][-1]['variants']
+            self.assertEqual({'src': '/media/' + image.image.name.replace('card.jpg', 'variants/card.400w.webp'), 'width': 400, 'height': 200, 'type': 'image/webp'}, variants[2])
+
+            old_variant = f"{media_root}/{image.image_variants['items'][0]['src']}"
+            with self.captureOnCommitCallbacks(execute=True):
+                image.image = SimpleUploadedFile('other.jpg', buffer.getvalue())
+                image.save()
+                self.assertEqual([], ProductSerializer(Product.objects.get(pk=self.one_product.pk)).data['images'][-1]['variants'])
+            self.assertFalse(os.path.exists(old_variant))
+            image.refresh_from_db()
+            self.assertTrue(os.path.exists(f"{media_root}/{image.image_variants['items'][0]['src']}"))
+
+            # та же картинка у другой записи берет готовые варианты, не перестраивая их
+            with mock.patch('backend.images.generate_variants') as generate_variants:
+                with self.captureOnCommitCallbacks(execute=True):
+                    shared = ProductImage.objects.create(product=self.one_product, image=image.image.name)
+            generate_variants.assert_not_called()
+            shared.refresh_from_db()
+            self.assertEqual(image.image_variants, shared.image_variants)
+            self.assertEqual([], [name for name in os.listdir(os.path.dirname(old_variant)) if name.startswith('.')])
+
+    def test_basket_atomic_mutations(self):
+        user = User.objects.get(username='Test')
+        self.client.force_authenticate(user=user)
+        line_url = reverse('basket') + '?return=line'
+        self.assertEqual(status.HTTP_201_CREATED, self.client.post(reverse('basket'), {'id': self.one_product.pk, 'count': 5}).status_code)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(line_url, {'id': self.one_product.pk, 'count': 5})
+        self.assertEqual(1, sum('INSERT INTO "shopapp_basketitem"' in query['sql'] for query in queries))
+        self.assertEqual(10, response.data['item']['count'])
+        self.assertEqual({'count': 10, 'positions': 1, 'totalCost': 10 * self.one_product.effective_price}, response.data['totals'])
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.post(line_url, {'id': self.one_product.pk, 'count': 1}).status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.post(line_url, {'id': 999, 'count': 1}).status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.post(line_url, {'id': self.one_product.pk, 'count': 0}).status_code)
+        self.assertEqual(10, BasketItem.objects.get(product=self.one_product).quantity)
+
+        response = self.client.delete(line_url, {'id': self.one_product.pk, 'count': 3})
+        self.assertEqual(7, response.data['item']['count'])
+        response = self.client.delete(line_url, {'id': self.one_product.pk, 'count': 10})
+        self.assertEqual({'item': None, 'totals': {'count': 0, 'positions': 0, 'totalCost': 0}}, response.data)
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.delete(line_url, {'id': self.one_product.pk, 'count': 1}).status_code)
+        self.assertFalse(BasketItem.objects.exists())
+
+    def test_basket_bulk(self):
+        self.client.force_authenticate(user=User.objects.create_user(username='NoBasket'))
+        response = self.client.post(reverse('basket-bulk'), [{'id': 999, 'count': 1}], format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertFalse(Basket.objects.filter(user__username='NoBasket').exists())
+
+        user = User.objects.get(username='Test')
+        self.client.force_authenticate(user=user)
+        second = Product.objects.create(category=self.one_category, price=300, count=3, title='Корпус')
+        third = Product.objects.create(category=self.one_category, price=200, count=5, title='Кулер')
+        self.client.post(reverse('basket'), {'id': third.pk, 'count': 2})
+        changes = [
+            {'id': self.one_product.pk, 'count': 4},
+            {'id': self.one_product.pk, 'count': 2, 'action': 'add'},
+            {'id': second.pk, 'count': 3, 'action': 'set'},
+            {'id': third.pk, 'count': 2, 'action': 'remove'},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('basket-bulk'), {'items': changes}, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual({self.one_product.pk: 6, second.pk: 3}, {item['id']: item['count'] for item in response.data})
+        self.assertEqual(1, sum(query['sql'].startswith('INSERT INTO "shopapp_basketitem"') for query in queries))
+        self.assertEqual(1, sum(query['sql'].startswith('DELETE FROM "shopapp_basketitem"') for query in queries))
+
+        response = self.client.post(reverse('basket-bulk'), [{'id': self.one_product.pk, 'count': 1, 'action': 'remove'}, {'id': second.pk, 'count': 1}], format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn(str(second.pk), response.json()['errors'])
+        self.assertEqual(6, BasketItem.objects.get(product=self.one_product).quantity)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.post(reverse('basket-bulk'), [{'id': second.pk, 'count': 0, 'action': 'add'}], format='json').status_code)
+
+        Product.objects.filter(pk=self.one_product.pk).update(count=2)
+        response = self.client.post(reverse('basket-bulk'), [{'id': self.one_product.pk, 'count': 1, 'action': 'remove'}], format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        response = self.client.post(reverse('basket-bulk'), [{'id': self.one_product.pk, 'count': 4, 'action': 'set'}], format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(4, BasketItem.objects.get(product=self.one_product).quantity)
+        response = self.client.post(reverse('basket-bulk'), [{'id': self.one_product.pk, 'count': 1, 'action': 'add'}], format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+        response = self.client.post(reverse('basket-bulk'), [{'id': self.one_product.pk, 'count': 0, 'action': 'set'}], format='json')
+        self.assertEqual([second.pk], [item['id'] for item in response.data])
+
+    def test_guest_basket(self):
+        self.client.logout()
+        second = Product.objects.create(category=self.one_category, price=300, count=3, title='Корпус')
+        user = User.objects.get(username='Test')
+        basket, _ = Basket.objects.get_or_create(user=user)
+        BasketItem.objects.create(basket=basket, product=second, quantity=2)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('basket'), {'id': self.one_product.pk, 'count': 4})
+            self.client.post(reverse('basket'), {'id': second.pk, 'count': 2})
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertFalse(any(query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) for query in queries))
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.post(reverse('basket'), {'id': second.pk, 'count': 2}).status_code)
+        response = self.client.delete(reverse('basket') + '?return=line', {'id': self.one_product.pk, 'count': 1})
+        self.assertEqual({'count': 5, 'positions': 2, 'totalCost': 3 * self.one_product.effective_price + 2 * second.effective_price}, response.data['totals'])
+        self.assertEqual({self.one_product.pk: 3, second.pk: 2}, {item['id']: item['count'] for item in self.client.get(reverse('basket')).data})
+        self.assertEqual(1, BasketItem.objects.count())
+
+        # корзина, которая не поместится в cookie, не меняется
+        third = Product.objects.create(category=self.one_category, price=100, count=3, title='Кулер')
+        size = len('basket=' + self.client.cookies['basket'].coded_value)
+        with override_settings(GUEST_BASKET_COOKIE_MAX_SIZE=size + 1):
+            response = self.client.post(reverse('basket'), {'id': third.pk, 'count': 1})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('id', response.data)
+        self.assertEqual(2, len(self.client.get(reverse('basket')).data))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('sign-in'), {'username': 'Test', 'password': 'Test'}, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(1, sum(query['sql'].startswith('INSERT INTO "shopapp_basketitem"') for query in queries))
+        self.assertEqual({self.one_product.pk: 3, second.pk: 3}, dict(basket.items.values_list('product_id', 'quantity')))
+        self.assertEqual('', self.client.cookies['basket'].value)
+        self.assertEqual(2, len(self.client.get(reverse('basket')).data))
+
+    def test_basket_summary(self):
+        user = User.objects.get(username='Test')
+        self.client.force_authenticate(user=user)
+        Basket.objects.filter(user=user).delete()
+        with CaptureQueriesContext(connection) as queries:
+            summary = self.client.get(reverse('basket-summary')).data
+        self.assertFalse(any(query['sql'].startswith('INSERT') for query in queries))
+        self.assertEqual({'count': 0, 'positions': 0, 'totalCost': 0, 'deliveryType': 'delivery', 'deliveryCost': 100, 'freeDeliveryFrom': 1000, 'total': 100}, summary)
+        self.assertFalse(Basket.objects.filter(user=user).exists())
+        basket, _ = Basket.objects.get_or_create(user=user)
+        products = Product.objects.bulk_create([Product(category=self.one_category, price=10, effective_price=10, count=5, title=f'Болт {i}') for i in range(30)])
+        BasketItem.objects.bulk_create([BasketItem(basket=basket, product=product, quantity=2) for product in products])
+        today = datetime.date.today()
+        Sale.objects.create(product=products[0], discount=4, date_from=today - datetime.timedelta(days=1), date_to=today + datetime.timedelta(days=1))
+
+        with CaptureQueriesContext(connection) as queries:
+            summary = self.client.get(reverse('basket-summary')).data
+        self.assertEqual(1, sum('shopapp_basketitem' in query['sql'] for query in queries))
+        self.assertEqual({'count': 60, 'positions': 30, 'totalCost': 592, 'deliveryType': 'delivery', 'deliveryCost': 100, 'freeDeliveryFrom': 1000, 'total': 692}, summary)
+        self.assertEqual(1192, self.client.get(reverse('basket-summary'), {'deliveryType': 'express'}).data['total'])
+
+        BasketItem.objects.create(basket=basket, product=self.one_product, quantity=1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('orders'))
+        self.assertLess(len(queries), 15)
+        order = Order.objects.get(pk=response.json()['orderId'])
+        self.assertEqual(1592, order.totalCost)
+        self.assertEqual(31, order.products.count())
@@ -1,10 +1,16 @@
 import datetime
+import math
 
 from django_filters.rest_framework import DjangoFilterBackend
-from django.http import JsonResponse, HttpResponse, HttpRequest
+from django.http import Http404, JsonResponse, HttpResponse, HttpRequest
 from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Min, Prefetch, Q
 from django.db.models.query import QuerySet
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import ListAPIView
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -14,6 +20,7 @@ from rest_framework.permissions import IsAuthenticated
 from .models import (
     Category,
     Product,
+    ProductQuerySet,
     Review,
     Tag,
     Sale,
@@ -23,9 +30,25 @@ from .models import (
     Order,
     Payment,
 )
+from .cache import CATALOG, CATEGORY_TREE, HOMEPAGE, make_key
+from .catalog_index import get_catalog_index
+from .documents import DocumentResponse, document_response, get_documents
+from .guest_basket import GuestBasket
+from .conditional import VersionsState, product_condition
+from .pagination import (
+    clamp_page_number,
+    cursor_page,
+    cursor_page_data,
+    int_param,
+    is_cursor_mode,
+)
+from .search import get_search_backend
+from .suggest import suggest_index
 from .serializers import (
     TagSerializer,
     ProductSerializer,
+    ProductShortSerializer,
+    BasketChangeSerializer,
     BasketItemSerializer,
     OrderSerializer,
     CategorySerializer,
@@ -34,14 +57,21 @@ from .serializers import (
 from myauth.models import ProfileUser
 
 
+@VersionsState(CATEGORY_TREE).decorator()
 class CategoryView(APIView):
 
     def get(self, request: HttpRequest) -> Response:
-        categories = Category.get_categories()
-        categories_serialized = CategorySerializer(categories, many=True)
-        return Response(categories_serialized.data)
+        key = make_key(CATEGORY_TREE, "serialized")
+        categories_data = cache.get(key)
+        if categories_data is None:
+            categories = Category.get_tree()
+            categories_data = CategorySerializer(categories, many=True).data
+            cache.set(key, categories_data, settings.CATEGORY_TREE_CACHE_TIMEOUT)
+        return Response(categories_data)
 
 
+# карточки каталога меняют и продукты, и их картинки, отзывы и скидки
+@VersionsState(CATALOG, HOMEPAGE).decorator()
 class CatalogView(APIView):
     filter_backends = [DjangoFilterBackend, OrderingFilter]
 
@@ -65,95 +95,276 @@ class CatalogView(APIView):
         "rating",
     ]
 
-    def filter_queryset(self, products: QuerySet[Product]) -> QuerySet[Product]:
-        category_id: int = self.request.GET.get("category")
-        min_price: float = float(self.request.GET.get("filter[minPrice]", 0))
-        max_price: float = float(self.request.GET.get("filter[maxPrice]", float("inf")))
-        free_delivery: bool = (
-            self.request.GET.get("filter[freeDelivery]", "").lower() == "true"
-        )
-        available: bool = self.request.GET.get("filter[available]", "").lower() == "true"
-        name: str = self.request.GET.get("filter[name]", "").strip()
-        tags: list[str] = self.request.GET.getlist("tags[]")
-        sort_field: str = self.request.GET.get("sort", "id")
-        sort_type: str = self.request.GET.get("sortType", "inc")
-
-        if category_id:
-            products = products.filter(category__id=category_id)
-        products = products.filter(price__gte=min_price, price__lte=max_price)
-        if free_delivery:
+    def get_filter_params(self) -> dict[str:any]:
+        """параметры фильтрации и сортировки каталога из запроса"""
+        min_price: str = self.request.GET.get("filter[minPrice]", "")
+        max_price: str = self.request.GET.get("filter[maxPrice]", "")
+        category_id: str | None = self.request.GET.get("category")
+        sort: str = self.request.GET.get("sort", "id")
+        if sort == "relevance":
+            sort_field = sort
+        elif sort in ProductQuerySet.SORT_FIELDS:
+            sort_field = ProductQuerySet.SORT_FIELDS[sort]
+        else:
+            raise ValidationError(
+                {"sort": f"Сортировка по '{sort}' не поддерживается"}
+            )
+        return {
+            "category_id": category_id,
+            "category_bounds": (
+                Category.get_subtree_bounds(category_id) if category_id else None
+            ),
+            "min_price": float(min_price) if min_price else None,
+            "max_price": float(max_price) if max_price else None,
+            "free_delivery": (
+                self.request.GET.get("filter[freeDelivery]", "").lower() == "true"
+            ),
+            "available": (
+                self.request.GET.get("filter[available]", "").lower() == "true"
+            ),
+            "name": self.request.GET.get("filter[name]", "").strip(),
+            "tags": self.request.GET.getlist("tags[]"),
+            "sort_field": sort_field,
+            "descending": self.request.GET.get("sortType", "inc") != "inc",
+        }
+
+    def filter_queryset(
+        self, products: QuerySet[Product], params: dict[str:any] | None = None
+    ) -> QuerySet[Product]:
+        """params - результат get_filter_params, если он уже посчитан"""
+        if params is None:
+            params = self.get_filter_params()
+        name: str = params["name"]
+        sort_field: str = params["sort_field"]
+
+        if params["category_id"]:
+            products = products.in_category(params["category_bounds"])
+        if params["min_price"] is not None:
+            products = products.filter(effective_price__gte=params["min_price"])
+        if params["max_price"] is not None:
+            products = products.filter(effective_price__lte=params["max_price"])
+        if params["free_delivery"]:
             products = products.filter(free_delivery=True)
-        if available:
+        if params["available"]:
             products = products.filter(count__gt=0)
         if name:
-            products = products.filter(title__icontains=name)
-        for tag in tags:
+            products = get_search_backend().search(products, name)
+        for tag in params["tags"]:
             products = products.filter(tags__name=tag)
-        if sort_type == "inc":
-            products = products.order_by(sort_field)
+        if sort_field == "relevance":
+            if name:
+                return products.order_by("-relevance", "id")
+            return products.order_by("id")
+        if params["descending"]:
+            products = products.order_by("-" + sort_field, "-id")
         else:
-            products = products.order_by("-" + sort_field)
+            products = products.order_by(sort_field, "id")
 
         return products
 
-    def get(self, request: HttpRequest) -> Response:
-        products = Product.objects.all()
-        filtered_products = self.filter_queryset(products)
-        page_number: int = int(request.GET.get("currentPage", 1))
-        limit: int = int(request.GET.get("limit", 20))
-        paginator = Paginator(filtered_products, limit)
-        page = paginator.get_page(page_number)
-        products_serialized = ProductSerializer(page, many=True)
-        catalog_data: dict[str: any] = {
-            "items": products_serialized.data,
-            "currentPage": page_number,
-            "lastPage": paginator.num_pages,
+    def get_page_from_index(
+        self, params: dict[str:any], page_number: int, limit: int
+    ) -> dict | None:
+        """id продуктов страницы каталога из колоночного индекса в памяти,
+        None если индекс выключен или не умеет такой запрос"""
+        catalog_index = get_catalog_index()
+        if (
+            catalog_index is None
+            or params["name"]
+            or not catalog_index.supports(params["sort_field"])
+        ):
+            return None
+        sort = params["sort_field"], params["descending"]
+        result = catalog_index.resolve(params, *sort, (page_number - 1) * limit, limit)
+        if result is None:
+            return None
+        ids, total = result
+        num_pages = max(1, math.ceil(total / limit))
+        current_page, last_page = clamp_page_number(page_number, num_pages)
+        if current_page != page_number:
+            offset = (current_page - 1) * limit
+            ids, total = catalog_index.resolve(params, *sort, offset, limit)
+        return {
+            "items": ids,
+            "currentPage": current_page,
+            "lastPage": last_page,
         }
-        return Response(catalog_data)
 
+    FACETS_IGNORED_PARAMS = (
+        "currentPage",
+        "limit",
+        "sort",
+        "sortType",
+        "cursor",
+        "pagination",
+        "facets",
+    )
+
+    @staticmethod
+    def count_facets(products: QuerySet[Product]) -> dict[str:any]:
+        """счетчики по тегам и категориям, диапазон цен и флаги - тремя запросами"""
+        products = products.order_by()
+        product_ids = products.values("pk")
+        totals = products.aggregate(
+            total=Count("pk", distinct=True),
+            min_price=Min("effective_price"),
+            max_price=Max("effective_price"),
+            free_delivery=Count("pk", filter=Q(free_delivery=True), distinct=True),
+            available=Count("pk", filter=Q(count__gt=0), distinct=True),
+        )
+        tags = (
+            Product.tags.through.objects.filter(product_id__in=product_ids)
+            .values("tag_id", "tag__name")
+            .annotate(count=Count("product_id", distinct=True))
+            .order_by("tag__name")
+        )
+        categories = (
+            Product.objects.filter(pk__in=product_ids)
+            .values("category_id", "category__title")
+            .annotate(count=Count("pk"))
+            .order_by("category__title")
+        )
+        return {
+            "total": totals["total"],
+            "price": {"min": totals["min_price"], "max": totals["max_price"]},
+            "freeDelivery": totals["free_delivery"],
+            "available": totals["available"],
+            "tags": [
+                {"id": tag["tag_id"], "name": tag["tag__name"], "count": tag["count"]}
+                for tag in tags
+            ],
+            "categories": [
+                {
+                    "id": category["category_id"],
+                    "title": category["category__title"],
+                    "count": category["count"],
+                }
+                for category in categories
+            ],
+        }
 
-class BannerListView(ListAPIView):
-    serializer_class = ProductSerializer
+    def get_facets(self, products: QuerySet[Product]) -> dict[str:any]:
+        """фасеты для текущего набора фильтров, кэшируются по нормализованным фильтрам"""
+        filters = sorted(
+            (key, sorted(values))
+            for key, values in self.request.GET.lists()
+            if key not in self.FACETS_IGNORED_PARAMS
+        )
+        key = make_key(CATALOG, "facets", filters)
+        facets = cache.get(key)
+        if facets is None:
+            facets = self.count_facets(products)
+            cache.set(key, facets, settings.CATALOG_FACETS_CACHE_TIMEOUT)
+        return facets
+
+    def get(self, request: HttpRequest) -> DocumentResponse | Response:
+        params = self.get_filter_params()
+        filtered_products = self.filter_queryset(Product.objects.all(), params)
+        page_number: int = int_param(request, "currentPage", 1)
+        limit: int = int_param(request, "limit", 20, min_value=1)
+        index_page = None
+        if not is_cursor_mode(request):
+            index_page = self.get_page_from_index(params, max(1, page_number), limit)
+        if index_page is not None:
+            catalog_data = index_page
+        elif is_cursor_mode(request):
+            sort_field, descending = params["sort_field"], params["descending"]
+            only = ["id", sort_field]
+            if sort_field == "relevance":
+                # курсор по (relevance, id) от лучших совпадений, без текста
+                # поиска релевантности нет и порядок - по id
+                only = ["id"]
+                sort_field, descending = (
+                    ("relevance", True) if params["name"] else ("id", False)
+                )
+            items, next_link, prev_link = cursor_page(
+                request,
+                filtered_products.only(*only),
+                sort_field=sort_field,
+                descending=descending,
+                limit=limit,
+            )
+            catalog_data = {
+                "items": [product.pk for product in items],
+                "next": next_link,
+                "prev": prev_link,
+            }
+        else:
+            paginator = Paginator(filtered_products.values_list("pk", flat=True), limit)
+            page_number, last_page = clamp_page_number(
+                page_number, paginator.num_pages
+            )
+            catalog_data: dict[str: any] = {
+                "items": list(paginator.get_page(page_number)),
+                "currentPage": page_number,
+                "lastPage": last_page,
+            }
+        if request.GET.get("facets", "").lower() == "true":
+            catalog_data["facets"] = self.get_facets(filtered_products)
+        cards = get_documents(catalog_data.pop("items"), "card")
+        return document_response(request, items=cards, **catalog_data)
 
-    def get_queryset(self):
-        return Product.objects.filter(rating__gt=0).order_by("-rating")[:3]
+
+class CachedListMixin:
+    """Кэш ответа списка главной страницы.
+
+    Ключ - класс представления и параметры запроса в пространстве HOMEPAGE,
+    которое сбрасывается сигналами при изменении продуктов, тегов, картинок,
+    отзывов и распродаж. cache_timeout - страховка на случай пропущенного сигнала.
+    """
+
+    cache_timeout: int = 60 * 15
 
     def list(self, request: HttpRequest, *args, **kwargs) -> Response:
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        params = sorted(request.GET.lists())
+        key = make_key(HOMEPAGE, self.__class__.__name__, params)
+        data = cache.get(key)
+        if data is None:
+            serializer = self.get_serializer(self.get_queryset(), many=True)
+            data = serializer.data
+            cache.set(key, data, self.cache_timeout)
+        return Response(data)
 
 
-class PopularListView(ListAPIView):
-    serializer_class = ProductSerializer
+class BannerListView(CachedListMixin, ListAPIView):
+    serializer_class = ProductShortSerializer
+    cache_timeout = 60 * 5
 
     def get_queryset(self):
-        # после реализации заказов подставить - .order_by("-countOfOrders")[:8]
-        return Product.objects.filter(tags__name__in=["popular"])[:8]
-
-    def list(self, request: HttpRequest, *args, **kwargs) -> Response:
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return (
+            Product.objects.for_list()
+            .filter(rating__gt=0)
+            .order_by("-rating")[:3]
+        )
 
 
-class LimitedListView(ListAPIView):
-    serializer_class = ProductSerializer
+class PopularListView(CachedListMixin, ListAPIView):
+    serializer_class = ProductShortSerializer
+    cache_timeout = 60 * 15
 
     def get_queryset(self):
-        return Product.objects.filter(tags__name__in=["limited"])[:16]
+        return Product.objects.for_list().order_by("-popularity", "-id")[:8]
 
-    def list(self, request: HttpRequest, *args, **kwargs) -> Response:
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
 
+class LimitedListView(CachedListMixin, ListAPIView):
+    serializer_class = ProductShortSerializer
+    cache_timeout = 60 * 15
+
+    def get_queryset(self):
+        return (
+            Product.objects.for_list()
+            .filter(tags__name__in=["limited"])
+            .order_by("title", "id")[:16]
+        )
 
+
+@product_condition
 class ProductDetailView(APIView):
-    def get(self, request: HttpRequest, product_id) -> Response:
-        product = Product.objects.get(id=product_id)
-        product_serializer = ProductSerializer(product)
-        return Response(product_serializer.data)
+    def get(self, request: HttpRequest, product_id) -> DocumentResponse | Response:
+        documents = get_documents([int(product_id)], "detail")
+        if not documents:
+            raise Http404
+        return document_response(request, documents[0])
 
 
 class ProductReviewView(APIView):
@@ -175,137 +386,221 @@ class ProductReviewView(APIView):
         return Response(status=201)
 
 
-class TagsListView(ListAPIView):
+@VersionsState(CATALOG).decorator()
+class TagsListView(CachedListMixin, ListAPIView):
     serializer_class = TagSerializer
+    cache_timeout = 60 * 60
 
     def get_queryset(self):
         return Tag.objects.all().distinct()
 
-    def list(self, request: HttpRequest, *args, **kwargs) -> Response:
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+
+class SuggestView(APIView):
+    """подсказки строки поиска из префиксного индекса в памяти, без запросов к базе"""
+
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request: HttpRequest) -> Response:
+        query: str = request.GET.get("q", "")
+        limit: int = min(max(int_param(request, "limit", 10), 1), 20)
+        return Response(suggest_index.suggest(query, limit))
 
 
 class SalesListView(APIView):
     def get(self, request: HttpRequest) -> Response:
-        page_number: int = int(request.GET.get("currentPage", 1))
-        limit: int = int(request.GET.get("limit", 20))
-        obj_list: list[Sale] = [obj for obj in Sale.objects.all()]
-        paginator = Paginator(obj_list, limit)
+        page_number: int = int_param(request, "currentPage", 1)
+        limit: int = int_param(request, "limit", 20, min_value=1)
+        sales = Sale.objects.active().for_list()
+        if is_cursor_mode(request):
+            response_data = cursor_page_data(
+                request, sales, SaleSerializer, limit=limit
+            )
+            return Response(response_data)
+        paginator = Paginator(sales.order_by("id"), limit)
+        page_number, last_page = clamp_page_number(page_number, paginator.num_pages)
         page = paginator.get_page(page_number)
         serialized_data = SaleSerializer(page, many=True)
         response_data: dict[str: any] = {
             "items": serialized_data.data,
             "currentPage": page_number,
-            "lastPage": paginator.num_pages,
+            "lastPage": last_page,
         }
         return Response(response_data)
 
 
 class BasketView(APIView):
+    """корзина пользователя, у анонимных посетителей - GuestBasket в cookie"""
+
+    @staticmethod
+    def get_basket_items(**filters) -> QuerySet[BasketItem]:
+        """позиции корзины вместе с данными продуктов для сериализации"""
+        return (
+            BasketItem.objects.filter(**filters)
+            .select_related("product")
+            .prefetch_related(*ProductQuerySet.card_prefetches("product__"))
+        )
 
-    permission_classes = [IsAuthenticated]
+    def get_items(
+        self, basket: Basket | GuestBasket, product_id: int | None = None
+    ) -> QuerySet[BasketItem] | list[BasketItem]:
+        if isinstance(basket, GuestBasket):
+            return basket.get_items(product_id)
+        if product_id is None:
+            return self.get_basket_items(basket=basket)
+        return self.get_basket_items(basket=basket, product_id=product_id)
 
     def get(self, request: HttpRequest) -> Response:
-        queryset = BasketItem.objects.filter(basket__user=request.user)
+        if request.user.is_authenticated:
+            queryset = self.get_basket_items(basket__user=request.user)
+        else:
+            queryset = GuestBasket(request).get_items()
         serializer = BasketItemSerializer(queryset, many=True)
 
         return Response(serializer.data)
 
-    def post(self, request: HttpRequest) -> Response:
-        id: int = request.data["id"]
-        count: int = int(request.data["count"])
-        product = Product.objects.get(id=id)
+    @staticmethod
+    def get_line(request: HttpRequest) -> tuple[int, int]:
+        """id продукта и положительное количество из тела запроса"""
+        try:
+            product_id, count = int(request.data["id"]), int(request.data["count"])
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError({"count": "Нужны целые id и count"})
+        if count <= 0:
+            raise ValidationError({"count": "Количество должно быть больше нуля"})
+        return product_id, count
+
+    def basket_response(
+        self,
+        request: HttpRequest,
+        basket: Basket | GuestBasket,
+        product_id: int,
+        status: int = 200,
+    ) -> Response:
+        """вся корзина или, с ?return=line, только измененная позиция и итоги"""
+        if request.query_params.get("return") == "line":
+            item = next(iter(self.get_items(basket, product_id)), None)
+            data = {
+                "item": BasketItemSerializer(item).data if item else None,
+                "totals": basket.get_totals(),
+            }
+        else:
+            data = BasketItemSerializer(self.get_items(basket), many=True).data
+        response = Response(data, status=status)
+        if isinstance(basket, GuestBasket):
+            basket.save(response)
+        return response
 
-        if product.count - count < 0:
+    def post(self, request: HttpRequest) -> Response:
+        product_id, count = self.get_line(request)
+        if request.user.is_authenticated:
+            basket, created = Basket.objects.get_or_create(user=request.user)
+            added = BasketItem.add(basket.pk, product_id, count) is not None
+        else:
+            basket = GuestBasket(request)
+            added = basket.add(product_id, count)
+            if added and not basket.fits():
+                raise ValidationError(
+                    {"id": "Корзина гостя заполнена, войдите, чтобы добавить товар"}
+                )
+        if not added:
             return Response(status=400)
+        return self.basket_response(request, basket, product_id, status=201)
 
-        basket, created = Basket.objects.get_or_create(user=request.user)
-
-        if created:
-            basket_item = BasketItem.objects.create(
-                basket=basket, product=product, quantity=count
+    def delete(self, request: HttpRequest) -> Response:
+        product_id, count = self.get_line(request)
+        if request.user.is_authenticated:
+            basket = Basket.objects.filter(user=request.user).first()
+            removed = basket is not None and BasketItem.remove(
+                basket.pk, product_id, count
             )
         else:
-            basket_item, created = BasketItem.objects.get_or_create(
-                basket=basket, product=product
-            )
-            if created:
-                basket_item.product = product
-                basket_item.quantity = count
-                basket_item.save()
-            else:
-                basket_item.quantity += count
-                if basket_item.quantity > product.count:
-                    return Response(status=400)
-                basket_item.save()
+            basket = GuestBasket(request)
+            removed = basket.remove(product_id, count)
+        if not removed:
+            return Response("Товары в корзине не найдены", status=404)
+        return self.basket_response(request, basket, product_id)
 
-        basket_items = BasketItem.objects.filter(basket=basket)
-        serializer = BasketItemSerializer(basket_items, many=True)
 
-        return Response(serializer.data, status=201)
+class BasketBulkView(APIView):
+    """пакетное изменение корзины: список {id, count, action} одной транзакцией"""
 
-    def delete(self, request: HttpRequest) -> Response:
-        id: int = request.data["id"]
-        count: int = request.data["count"]
-
-        try:
-            basket: Basket = request.user.basket
-            product = Product.objects.get(id=id)
-            basket_item = BasketItem.objects.get(basket=basket, product=product)
-            if basket_item.quantity > count:
-                basket_item.quantity -= (
-                    count 
-                )
-                basket_item.save()
-            else:
-                basket_item.delete()
+    permission_classes = [IsAuthenticated]
 
-            basket_items = BasketItem.objects.filter(basket=basket)
-            serializer = BasketItemSerializer(basket_items, many=True)
+    def post(self, request: HttpRequest) -> Response:
+        changes = request.data
+        if isinstance(changes, dict):
+            changes = changes.get("items")
+        serializer = BasketChangeSerializer(
+            data=changes, many=True, max_length=settings.BASKET_BULK_MAX_ITEMS
+        )
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            basket, created = Basket.objects.get_or_create(user=request.user)
+            errors = basket.apply_changes(serializer.validated_data)
+            if errors:
+                # корзина, созданная для отклоненных изменений, не остается в базе
+                transaction.set_rollback(True)
+        if errors:
+            return Response({"errors": errors}, status=400)
+        basket_items = BasketView.get_basket_items(basket=basket)
+        return Response(BasketItemSerializer(basket_items, many=True).data)
+
+
+class BasketSummaryView(APIView):
+    """итоги корзины: количество, сумма со скидками, доставка и сумма к оплате"""
 
-            return Response(serializer.data)
-        except Basket.DoesNotExist:
-            return Response("Товары в корзине не найдены", status=404)
+    def get(self, request: HttpRequest) -> Response:
+        delivery_type = request.query_params.get("deliveryType", "delivery")
+        if delivery_type not in ("delivery", "express"):
+            raise ValidationError({"deliveryType": "Неизвестный тип доставки"})
+        if not request.user.is_authenticated:
+            return Response(GuestBasket(request).get_summary(delivery_type))
+        # GET ничего не пишет: без корзины итоги пустые
+        basket = Basket.objects.filter(user=request.user).first()
+        if basket is None:
+            return Response(Basket.empty_summary(delivery_type))
+        return Response(basket.get_summary(delivery_type))
+
+
+def get_orders_with_products() -> QuerySet[Order]:
+    """заказы вместе с данными продуктов для OrderSerializer"""
+    return Order.objects.prefetch_related(
+        Prefetch(
+            "products", queryset=Product.objects.for_serializer().order_by("title")
+        )
+    )
 
 
 class OrderView(APIView):
 
     def get(self, request: HttpRequest) -> Response:
         profile = ProfileUser.objects.get(user=request.user)
-        orders = Order.objects.filter(customer=profile)
+        orders = get_orders_with_products().filter(customer=profile)
         orders_serialized = OrderSerializer(orders, many=True)
         return Response(orders_serialized.data)
 
     def post(self, request: HttpRequest) -> JsonResponse:
-        try:
-            basket: Basket = request.user.basket
-            profile = ProfileUser.objects.get(user=request.user)
-            total_cost = basket.get_total_cost()
-            order = Order.objects.create(
-                customer=profile,
-                basket=basket,
-            )
-            delivery_price = DeliveryPrice.objects.get(id=1)
-            if total_cost > delivery_price.delivery_free_minimum_cost:
-                order.totalCost = total_cost
-            else:
-                order.totalCost = total_cost + delivery_price.delivery_cost
-            products = basket.get_products()
-            order.products.set(products)
-            request.session["products"] = request.data
-            order.save()
-            response_data = {"orderId": order.pk}
-            return JsonResponse(response_data)
-        except Basket.DoesNotExist:
+        basket = Basket.objects.filter(user=request.user).first()
+        if basket is None:
             error_data = {"error": "У данного пользователя пока нет 'корзины'"}
             return JsonResponse(error_data)
+        profile = ProfileUser.objects.get(user=request.user)
+        summary = basket.get_summary()
+        order = Order.objects.create(
+            customer=profile,
+            basket=basket,
+            totalCost=summary["total"],
+        )
+        order.products.set(basket.items.values_list("product_id", flat=True))
+        request.session["products"] = request.data
+        response_data = {"orderId": order.pk}
+        return JsonResponse(response_data)
 
 
 class OrderDetailView(APIView):
     def get(self, request: HttpRequest, order_id: int) -> Response:
-        order = Order.objects.get(pk=order_id)
+        order = get_orders_with_products().get(pk=order_id)
         serializer = OrderSerializer(order)
         if "products" in request.session:
             products = request.session["products"]
@@ -377,18 +672,18 @@ class PaymentView(APIView):
 
         basket = Basket.objects.get(user=request.user)
         basket_items = BasketItem.objects.filter(basket=basket)
-        for basket_item in basket_items:
-            product = Product.objects.get(pk=basket_item.product.pk)
-            if product.count < basket_item.quantity:
-                return JsonResponse(
-                    {"error": "Недостаточно товаров в наличии"}, status=400
-                )
-            product.count -= basket_item.quantity
-            product.save()
+        quantities = dict(basket_items.values_list("product_id", "quantity"))
+        if not Product.take_from_stock(quantities):
+            return JsonResponse(
+                {"error": "Недостаточно товаров в наличии"}, status=400
+            )
+        if quantities:
             payment.success = True
             payment.save()
         basket_items.delete()
 
+        if order.status != "paid":
+            Product.register_order(list(order.products.values_list("pk", flat=True)))
         order.status = "paid"
         order.save()
         return HttpResponse(status=200)